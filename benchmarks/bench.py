@@ -0,0 +1,175 @@
+"""
+ Benchmarks for Board and AIPlayer on a fixed set of positions.
+
+     python -m benchmarks.bench run --out new.json
+     python -m benchmarks.bench compare baseline.json new.json
+
+ 'run' writes the results as JSON. 'compare' reports every timing that got
+ more than --threshold slower than the baseline and exits with status 1 if
+ there were any.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import timeit
+
+from connect4.board import Board
+from connect4.ai_player import AIPlayer
+from benchmarks.positions import POSITIONS
+
+
+def board_for(position):
+    """ returns (board, checker to move) for an entry of POSITIONS """
+    b = Board(6, 7)
+    b.add_checkers(position['moves'])
+    return b, 'X' if len(position['moves']) % 2 == 0 else 'O'
+
+
+def micro_benchmarks(number=2000):
+    """ returns {name: nanoseconds per call} for the basic Board operations,
+        averaged over every benchmark position """
+    boards = [board_for(p)[0] for p in POSITIONS]
+
+    def win_check():
+        for b in boards:
+            b.is_win_for('X')
+
+    def copy():
+        for b in boards:
+            b.copy()
+
+    def can_add_to():
+        for b in boards:
+            b.can_add_to(3)
+
+    def play_undo():
+        for b in boards:
+            if b.can_add_to(0):
+                b.play('X', 0)
+                b.undo()
+
+    results = {}
+    for name, fn in (('is_win_for', win_check), ('copy', copy),
+                     ('can_add_to', can_add_to), ('play_undo', play_undo)):
+        seconds = min(timeit.repeat(fn, number=number, repeat=3))
+        results[name] = seconds / (number * len(boards)) * 1e9
+    return results
+
+
+def search_benchmarks(algos, lookaheads):
+    """ returns {'ALGO/lookahead': {...}} with the time and node count of
+        next_move on every position, plus totals and nodes per second """
+    results = {}
+    for algo in algos:
+        for lookahead in lookaheads:
+            per_position = {}
+            total_seconds = 0.0
+            total_nodes = 0
+            for position in POSITIONS:
+                b, checker = board_for(position)
+                ai = AIPlayer(checker, 'LEFT', lookahead, algo)
+                start = time.perf_counter()
+                col = ai.next_move(b)
+                seconds = time.perf_counter() - start
+                entry = {'seconds': seconds, 'nodes': ai.nodes, 'move': col}
+                if position['win_depth'] is not None and lookahead >= position['win_depth']:
+                    # a forced win must be found once the lookahead reaches it
+                    entry['found_win'] = max(ai.scores_for(b)) == 100
+                per_position[position['name']] = entry
+                total_seconds += seconds
+                total_nodes += ai.nodes
+            results[algo + '/' + str(lookahead)] = {
+                'seconds': total_seconds,
+                'nodes': total_nodes,
+                'nodes_per_second': total_nodes / total_seconds if total_seconds else 0.0,
+                'positions': per_position,
+            }
+    return results
+
+
+def run(args):
+    """ runs the benchmarks and writes the JSON results """
+    lookaheads = [int(n) for n in args.lookaheads.split(',')]
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        },
+        'micro': micro_benchmarks(),
+        'search': search_benchmarks(args.algos.split(','), lookaheads),
+    }
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for name, row in results['search'].items():
+        missed = [p for p, e in row['positions'].items() if e.get('found_win') is False]
+        print(name, round(row['seconds'], 3), 's',
+              int(row['nodes_per_second']), 'nodes/s',
+              'MISSED WINS: ' + ', '.join(missed) if missed else '', file=sys.stderr)
+    return 0
+
+
+def regressions(baseline, current, threshold):
+    """ returns a list of messages, one per timing in current that is more
+        than threshold (a fraction) slower than the same timing in baseline """
+    found = []
+    for name, ns in current['micro'].items():
+        old = baseline['micro'].get(name)
+        if old and ns > old * (1 + threshold):
+            found.append('micro ' + name + ': ' + str(round(old)) + ' -> ' + str(round(ns)) + ' ns')
+    for name, row in current['search'].items():
+        old = baseline['search'].get(name)
+        if not old:
+            continue
+        if row['seconds'] > old['seconds'] * (1 + threshold):
+            found.append('search ' + name + ': ' + str(round(old['seconds'], 3)) +
+                         ' -> ' + str(round(row['seconds'], 3)) + ' s')
+        for pos, entry in row['positions'].items():
+            if entry.get('found_win') is False and \
+               old['positions'].get(pos, {}).get('found_win'):
+                found.append('search ' + name + ': no longer finds the win in ' + pos)
+    return found
+
+
+def compare(args):
+    """ compares two result files and reports regressions """
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    found = regressions(baseline, current, args.threshold)
+    for message in found:
+        print('REGRESSION', message)
+    if not found:
+        print('no regressions')
+    return 1 if found else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Connect Four benchmarks.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--out', help='file to write the JSON results to')
+    run_parser.add_argument('--algos', default='MINIMAX,ALPHABETA')
+    run_parser.add_argument('--lookaheads', default='2,4,6')
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='allowed slowdown as a fraction (default 0.10)')
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run(args)
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
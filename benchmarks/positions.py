@@ -0,0 +1,28 @@
+"""
+ Fixed 6x7 positions for the benchmarks, as Board.add_checkers move strings.
+
+ win_depth is the lookahead at which the side to move first finds a forced
+ win, or None where there is no forced win within 7 plies.
+"""
+
+POSITIONS = [
+    # openings
+    {'name': 'empty', 'kind': 'opening', 'moves': '', 'win_depth': None},
+    {'name': 'center', 'kind': 'opening', 'moves': '3', 'win_depth': None},
+    {'name': 'center-stack', 'kind': 'opening', 'moves': '33', 'win_depth': None},
+    {'name': 'wide-center', 'kind': 'opening', 'moves': '444333', 'win_depth': None},
+    # midgames
+    {'name': 'twin-stacks', 'kind': 'midgame', 'moves': '32232112', 'win_depth': None},
+    {'name': 'left-lean', 'kind': 'midgame', 'moves': '3332244', 'win_depth': None},
+    {'name': 'center-tower', 'kind': 'midgame', 'moves': '3433342', 'win_depth': None},
+    {'name': 'crossed', 'kind': 'midgame', 'moves': '3233220', 'win_depth': None},
+    # endgames and tactics with known forced wins
+    {'name': 'open-two', 'kind': 'endgame', 'moves': '3322', 'win_depth': 3},
+    {'name': 'open-three', 'kind': 'endgame', 'moves': '001122', 'win_depth': 1},
+    {'name': 'right-six', 'kind': 'endgame', 'moves': '6315513335', 'win_depth': 5},
+    {'name': 'crowded-left', 'kind': 'endgame', 'moves': '344564445604', 'win_depth': 5},
+    {'name': 'long-middle', 'kind': 'endgame', 'moves': '4441250330334534', 'win_depth': 5},
+    {'name': 'deep-tower', 'kind': 'endgame', 'moves': '023330006331123205226', 'win_depth': 7},
+    {'name': 'deep-spread', 'kind': 'endgame', 'moves': '3225430304603', 'win_depth': 7},
+    {'name': 'deep-center', 'kind': 'endgame', 'moves': '4404621006135', 'win_depth': 7},
+]
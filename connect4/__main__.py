@@ -0,0 +1,7 @@
+"""
+ python -m connect4 runs the headless engine (see connect4.engine)
+"""
+
+from .engine import main
+
+main()
@@ -2,26 +2,122 @@
 AI Player for use in Connect Four  
 """
 
+import hashlib
+import pickle
 import random
+import time
 from .connect_four import *
+from .transposition import TranspositionTable, EXACT, LOWER, UPPER, O_TO_MOVE
+from .disktable import DiskTable
+from .ordering import ORDERINGS
+from .evaluation import EVALUATORS
+from . import parallel
+from .book import OpeningBook
+from .stats import SearchStats
+from .solver import Solver, plies_to_end
+
+
+class SearchTimeout(Exception):
+    """ raised inside the search when its time budget runs out """
+    pass
+
+
+def table_salt(kind):
+    """ returns a 64-bit number for the string kind, the same in every
+        process, to keep one kind of player's DiskTable keys apart from
+        another's """
+    return int.from_bytes(hashlib.blake2b(kind.encode(), digest_size=8).digest(), 'little')
 
 
 class AIPlayer(Player):
     """ subclass of Player class that represents an intelligent computer player;
         Inherits from Player """
     
-    def __init__(self, checker, tiebreak, lookahead, algo='MINIMAX'):
+    def __init__(self, checker, tiebreak, lookahead, algo='MINIMAX',
+                 tt_size=0, tt_policy='DEPTH', ordering='HEURISTIC',
+                 time_budget=None, evaluator='NONE', workers=0, book=None,
+                 cache=None):
         """ contructs a AI player Object with checker, num_moves,
             tiebreak, and lookahead attributes 
+            tt_size > 0 gives the ALPHABETA search a transposition table
+            with that many entries, kept for the life of the player
+            ordering is the ALPHABETA move ordering: 'FIXED', 'CENTER',
+            'HEURISTIC' or an object with the same methods as those in
+            connect4.ordering
+            time_budget, in seconds, makes next_move deepen iteratively
+            until the time is up rather than stop at lookahead
+            evaluator scores positions where the lookahead runs out: 'NONE'
+            (always 0), 'WINDOWS' or any callable(board, checker) returning
+            a value strictly between -1 and 1 for checker
+            workers > 1 searches the root columns in parallel on a shared
+            pool of that many processes (ordering and evaluator must then
+            be names or picklable objects); each column starts with an
+            empty table and fresh ordering, so with tt_size > 0 the scores
+            are those of a serial search of that column alone. The pool's
+            processes are started fresh rather than forked, so a script
+            using it needs the usual if __name__ == '__main__' guard
+            book is an OpeningBook, or the path of one, whose scores are used
+            instead of searching for the positions it covers
+            algo 'SOLVE' plays perfectly by solving the position exactly
+            (4 in a row only);
+            lookahead, time_budget and workers are then ignored and tt_size
+            (default 1 << 20) sizes the solver's table
+            cache is the path of a DiskTable file to use instead of an
+            in-memory table, shared with other processes and kept between
+            runs; tt_size (default 1 << 20) sizes it if it is new
         """
         assert(checker == 'X' or checker == 'O')
         assert(tiebreak == 'LEFT' or tiebreak == 'RIGHT' or tiebreak == 'RANDOM')
         assert(lookahead >= 0)
+        assert(tt_size >= 0)
+        assert(workers >= 0)
+        assert(algo in ('MINIMAX', 'ALPHABETA', 'SOLVE'))
         super().__init__(checker)
+        # what a worker process needs to build an AIPlayer just like this one
+        self._args = dict(checker=checker, tiebreak=tiebreak, lookahead=lookahead,
+                          algo=algo, tt_size=tt_size, tt_policy=tt_policy,
+                          ordering=ordering, evaluator=evaluator, cache=cache)
+        self._pickled_args = None
         self.tiebreak = tiebreak
         self.lookahead = lookahead
-        # algo may be 'MINIMAX' or 'ALPHABETA'
+        # algo may be 'MINIMAX', 'ALPHABETA' or 'SOLVE'
         self.algo = algo
+        self.tt = None
+        if cache is not None:
+            # values depend on who the player is and how it evaluates, so
+            # each kind of player has its own keys within the file
+            kind = algo + ' ' + checker + ' ' + (evaluator if isinstance(evaluator, str)
+                                                 else type(evaluator).__qualname__)
+            self.tt = DiskTable(cache, tt_size or 1 << 20,
+                                'ALWAYS' if algo == 'SOLVE' else tt_policy, table_salt(kind))
+        elif algo == 'SOLVE':
+            self.tt = TranspositionTable(tt_size or 1 << 20, 'ALWAYS')
+        elif tt_size > 0:
+            self.tt = TranspositionTable(tt_size, tt_policy)
+        self.solver = None
+        if isinstance(ordering, str):
+            assert(ordering in ORDERINGS)
+            ordering = ORDERINGS[ordering]()
+        self.ordering = ordering
+        if isinstance(evaluator, str):
+            assert(evaluator in EVALUATORS)
+            evaluator = EVALUATORS[evaluator]()
+        self.evaluator = evaluator
+        self.time_budget = time_budget
+        self.workers = workers
+        if isinstance(book, str):
+            book = OpeningBook(book)
+        self.book = book
+        # depth of the last completed search, and the search node count
+        self.last_depth = 0
+        self.nodes = 0
+        self._deadline = None
+        # set to a threading.Event (or anything with is_set()) to let
+        # another thread abandon the search in progress
+        self.cancel_event = None
+        # counters for the most recent move (or scores_for call)
+        self.stats = SearchStats()
+        self._search_depth = 0
          
     def __repr__(self):
         """ Overrides Player __repr__ method;
@@ -41,132 +137,468 @@ class AIPlayer(Player):
             return max_score_indices[-1]
         return random.choice(max_score_indices)
     
-    def minimax(self, board, depth, player_checker):
+    def terminal_value(self, board, player_checker, last_move):
+        """Return 1/-1 if the game on 'board' is won for this AI/its opponent, else None.
+
+        last_move is the (row, col) of the checker just dropped by the player
+        before player_checker; only the lines through it are checked. With
+        last_move=None the whole board is scanned (for boards handed in from
+        outside the search).
+        """
+        if last_move is None:
+            if board.is_win_for(self.checker):
+                return 1
+            if board.is_win_for(self.opponent_checker()):
+                return -1
+            return None
+        if board.is_win_at(*last_move):
+            return -1 if player_checker == self.checker else 1
+        return None
+
+    def minimax(self, board, depth, player_checker, last_move=None):
         """Return -1/0/1 for loss/neutral/win from this AI's perspective using plain minimax.
 
-        player_checker indicates whose turn it is on 'board'.
+        player_checker indicates whose turn it is on 'board'; last_move is
+        the (row, col) the previous checker landed in, if known. Where the
+        depth runs out, the evaluator's value (strictly between -1 and 1)
+        stands in for 0. Children are searched by play()/undo() on 'board'
+        itself, which is left as it was found on return.
         """
+        self.check_deadline()
         # terminal states
-        if board.is_win_for(self.checker):
-            return 1
-        if board.is_win_for(self.opponent_checker()):
-            return -1
-        if depth == 0:
-            return 0
+        term = self.terminal_value(board, player_checker, last_move)
+        if term is not None or depth == 0:
+            stats = self.stats
+            ply = self._search_depth - depth
+            if ply > stats.max_ply:
+                stats.max_ply = ply
+            if term is not None:
+                stats.terminal_nodes += 1
+                return term
+            return self.evaluator(board, self.checker)
+
+        value, cols = self.pre_pass(board, depth, player_checker)
+        if value is not None:
+            return value
 
         if player_checker == self.checker:
             # max player
             best = -2
-            for c in range(board.width):
-                if not board.can_add_to(c):
-                    continue
-                nb = board.copy()
-                nb.add_checker(player_checker, c)
-                val = self.minimax(nb, depth - 1, self.opponent_checker())
+            for c in cols:
+                row = board.play(player_checker, c)
+                val = self.minimax(board, depth - 1, self.opponent_checker(), (row, c))
+                board.undo()
                 if val > best:
                     best = val
                     if best == 1:
+                        self.stats.cutoffs += 1
                         break
             return best
         else:
             # min player 
             best = 2
-            for c in range(board.width):
-                if not board.can_add_to(c):
-                    continue
-                nb = board.copy()
-                nb.add_checker(player_checker, c)
-                val = self.minimax(nb, depth - 1, self.checker)
+            for c in cols:
+                row = board.play(player_checker, c)
+                val = self.minimax(board, depth - 1, self.checker, (row, c))
+                board.undo()
                 if val < best:
                     best = val
                     if best == -1:
+                        self.stats.cutoffs += 1
                         break
             return best
 
-    def alphabeta(self, board, depth, player_checker, alpha, beta):
+    def pre_pass(self, board, depth, player_checker):
+        """Return (value, cols) from a tactical look at board with
+        player_checker to move and depth plies left.
+
+        value is 1/-1 when the position is already decided: the side to
+        move can win at once, or (with depth >= 2) every move lets the
+        opponent win at once. Otherwise value is None and cols lists the
+        columns worth searching: with depth >= 2, the forced block if there
+        is one and never a column under an opponent's winning slot, since
+        those lose on the next move whatever the evaluator says.
+        """
+        if depth >= 1 and board.threats(player_checker) & board.playable():
+            self.stats.terminal_nodes += 1
+            return (1 if player_checker == self.checker else -1), None
+        if depth >= 2:
+            cols = board.columns_of(board.safe_moves(player_checker))
+            if not cols:
+                self.stats.terminal_nodes += 1
+                return (-1 if player_checker == self.checker else 1), None
+            return None, cols
+        return None, [c for c in range(board.width) if board.can_add_to(c)]
+
+    def alphabeta(self, board, depth, player_checker, alpha, beta, last_move=None):
         """Return -1/0/1 using negamax-style alpha-beta (player_checker's turn).
 
-        alpha/beta are bounds in the same -2..2 domain.
+        alpha/beta are bounds in the same -2..2 domain; last_move and the
+        evaluator are used as in minimax. When this AI has a transposition
+        table, results are looked up and stored there under the board's
+        canonical Zobrist hash, so a position and its mirror image share
+        one entry (the best column is stored as seen from the canonical
+        side).
         """
+        self.check_deadline()
         # terminal 
-        if board.is_win_for(self.checker):
-            return 1
-        if board.is_win_for(self.opponent_checker()):
-            return -1
-        if depth == 0:
-            return 0
+        term = self.terminal_value(board, player_checker, last_move)
+        if term is not None or depth == 0:
+            stats = self.stats
+            ply = self._search_depth - depth
+            if ply > stats.max_ply:
+                stats.max_ply = ply
+            if term is not None:
+                stats.terminal_nodes += 1
+                return term
+            return self.evaluator(board, self.checker)
+
+        value, allowed = self.pre_pass(board, depth, player_checker)
+        if value is not None:
+            return value
+
+        tt = self.tt
+        tt_move = -1
+        if tt is not None:
+            key, mirrored = board.canonical_hash()
+            if player_checker == 'O':
+                key ^= O_TO_MOVE
+            entry = tt.probe(key)
+            if entry is not None:
+                tt_move = entry[3]
+                if mirrored and tt_move >= 0:
+                    tt_move = board.width - 1 - tt_move
+            if entry is not None and entry[0] >= depth:
+                stored, flag = entry[1], entry[2]
+                if flag == EXACT:
+                    return stored
+                if flag == LOWER and stored > alpha:
+                    alpha = stored
+                elif flag == UPPER and stored < beta:
+                    beta = stored
+                if alpha >= beta:
+                    return stored
+        alpha0 = alpha
+        beta0 = beta
+        best_col = -1
+        # the ordering only changes which moves get pruned, not the value
+        ply = self._search_depth - depth
+        cols = self.ordering.columns(board, depth, player_checker, tt_move, ply)
+        if len(allowed) < len(cols):
+            cols = [c for c in cols if c in allowed]
 
         if player_checker == self.checker:
             # max
             value = -2
-            for c in range(board.width):
-                if not board.can_add_to(c):
-                    continue
-                nb = board.copy()
-                nb.add_checker(player_checker, c)
-                val = self.alphabeta(nb, depth - 1, self.opponent_checker(), alpha, beta)
+            for c in cols:
+                row = board.play(player_checker, c)
+                val = self.alphabeta(board, depth - 1, self.opponent_checker(), alpha, beta, (row, c))
+                board.undo()
                 if val > value:
                     value = val
+                    best_col = c
                 if value > alpha:
                     alpha = value
                 if alpha >= beta:
+                    self.stats.cutoffs += 1
+                    self.ordering.cutoff(c, depth, player_checker, ply)
                     break
-            return value
         else:
             # min
             value = 2
-            for c in range(board.width):
-                if not board.can_add_to(c):
-                    continue
-                nb = board.copy()
-                nb.add_checker(player_checker, c)
-                val = self.alphabeta(nb, depth - 1, self.checker, alpha, beta)
+            for c in cols:
+                row = board.play(player_checker, c)
+                val = self.alphabeta(board, depth - 1, self.checker, alpha, beta, (row, c))
+                board.undo()
                 if val < value:
                     value = val
+                    best_col = c
                 if value < beta:
                     beta = value
                 if alpha >= beta:
+                    self.stats.cutoffs += 1
+                    self.ordering.cutoff(c, depth, player_checker, ply)
                     break
-            return value
-    def scores_for(self, b):
+
+        if tt is not None:
+            if value <= alpha0:
+                flag = UPPER
+            elif value >= beta0:
+                flag = LOWER
+            else:
+                flag = EXACT
+            if mirrored and best_col >= 0:
+                best_col = board.width - 1 - best_col
+            tt.store(key, depth, value, flag, best_col)
+        return value
+
+    def scores_for(self, b, lookahead=None, known=None):
         """Return a list of scores for each column on board b using plain minimax.
 
         This implements a simple depth-limited minimax (no alpha-beta). The
         minimax value domain is {-1, 0, 1} (loss/neutral/win) from this AI's
         perspective. We map those to the existing score scale {0,50,100} so the
-        rest of the code (max_score_column) remains unchanged.
+        rest of the code (max_score_column) remains unchanged. With an
+        evaluator, undecided columns score between 1 and 99 instead of 50.
+
+        lookahead overrides self.lookahead for this call. known may hold the
+        scores of a shallower search of the same board; columns it already
+        proved won (100) or lost (0) are not searched again.
+        """
+        if lookahead is None:
+            lookahead = self.lookahead
+
+        if known is None:
+            self.stats = SearchStats()
+        start = time.perf_counter()
+        tt_before = (self.tt.hits, self.tt.misses) if self.tt is not None else None
+        try:
+            if self.algo == 'SOLVE':
+                scores = self.solve_scores(b)
+            elif self.workers > 1 and lookahead > 0:
+                scores = self.parallel_scores(b, lookahead, known)
+            else:
+                scores = self.serial_scores(b, lookahead, known)
+        finally:
+            self.stats.seconds += time.perf_counter() - start
+            if tt_before is not None:
+                self.stats.tt_hits += self.tt.hits - tt_before[0]
+                self.stats.tt_misses += self.tt.misses - tt_before[1]
+        if self.algo != 'SOLVE':
+            self.last_depth = self.stats.depth = lookahead
+        return scores
+
+    def solve_scores(self, b):
+        """Return scores for board b from an exact solve: 50 plus the
+        solver's score (see connect4.solver) for every best column, and
+        something lower for the rest, so max_score_column picks among the
+        perfect moves. last_depth is set to the plies left in the game.
         """
+        solver = self.solver
+        if solver is None or solver.height != b.height or solver.width != b.width:
+            # solver keys are only unique within one board size
+            if isinstance(self.tt, DiskTable):
+                self.tt.salt = table_salt('SOLVE ' + str(b.height) + 'x' + str(b.width))
+            elif solver is not None:
+                self.tt.clear()
+            solver = self.solver = Solver(b.height, b.width, self.tt, self.check_stop)
+        first = nodes = solver.nodes
+        best = solver.solve(b, self.checker)
+        self.stats.root_nodes += solver.nodes - nodes
+        scores = [-1] * b.width
+        for col in self.root_columns(b):
+            col_start = time.perf_counter()
+            nodes = solver.nodes
+            bound = solver.column_bound(b, self.checker, col, best)
+            if bound is not None:
+                scores[col] = 50 + bound
+                self.stats.add_column(col, solver.nodes - nodes,
+                                      time.perf_counter() - col_start)
+        self.mirror_scores(b, scores)
+        self.nodes += solver.nodes - first
+        self.last_depth = self.stats.depth = plies_to_end(best, b.moves, b.width * b.height)
+        return scores
 
+    def serial_scores(self, b, lookahead, known=None):
+        """Return the scores_for scores, searching the columns one by one
+        in this process."""
+        # the search plays and undoes moves on one private copy of b
+        # rather than copying the board at every node
+        nb = b.copy()
+        if known is None:
+            self.ordering.new_search()
         scores = [0] * b.width
-        for col in range(b.width):
+        for col in self.root_columns(b):
             if not b.can_add_to(col):
                 scores[col] = -1
-                continue
+            elif known is not None and known[col] in (0, 100):
+                scores[col] = known[col]
+            else:
+                scores[col] = self.column_score(nb, col, lookahead)
+        return self.mirror_scores(b, scores)
+
+    def root_columns(self, b):
+        """Return the columns whose scores must be searched on board b: all
+        of them, or only the left half and middle if b is symmetric."""
+        if b.is_symmetric():
+            return range((b.width + 1) // 2)
+        return range(b.width)
+
+    def mirror_scores(self, b, scores):
+        """Copy the scores of the columns root_columns searched onto their
+        mirror images if b is symmetric, so tiebreak sees both; returns
+        scores."""
+        if b.is_symmetric():
+            for col in range((b.width + 1) // 2, b.width):
+                scores[col] = scores[b.width - 1 - col]
+        return scores
 
-            nb = b.copy()
-            nb.add_checker(self.checker, col)
+    def column_score(self, board, col, lookahead, time_left=None):
+        """Return the 0..100 score of playing col on board, searching
+        lookahead moves deep in all.
 
-            if nb.is_win_for(self.checker):
-                scores[col] = 100
-            elif self.lookahead == 0:
-                scores[col] = 50
+        board is played on and restored. With time_left (in seconds) the
+        search raises SearchTimeout once that much time has passed.
+        """
+        start = time.perf_counter()
+        nodes = self.nodes
+        self._search_depth = lookahead
+        if time_left is not None:
+            self._deadline = start + time_left
+        try:
+            row = board.play(self.checker, col)
+            if board.is_win_at(row, col):
+                return 100
+            if lookahead == 0:
+                return 50
+            if getattr(self, 'algo', 'MINIMAX') == 'ALPHABETA':
+                val = self.alphabeta(board, lookahead - 1, self.opponent_checker(), -2, 2, (row, col))
             else:
-                if getattr(self, 'algo', 'MINIMAX') == 'ALPHABETA':
-                    val = self.alphabeta(nb, self.lookahead - 1, self.opponent_checker(), -2, 2)
-                else:
-                    val = self.minimax(nb, self.lookahead - 1, self.opponent_checker())
-                if val > 0:
-                    scores[col] = 100
-                elif val < 0:
-                    scores[col] = 0
-                else:
-                    scores[col] = 50
+                val = self.minimax(board, lookahead - 1, self.opponent_checker(), (row, col))
+            if val >= 1:
+                return 100
+            elif val <= -1:
+                return 0
+            # undecided: 50, moved towards 1 or 99 by the evaluator
+            return 50 + round(49 * val)
+        finally:
+            board.undo()
+            if time_left is not None:
+                self._deadline = None
+            self.stats.add_column(col, self.nodes - nodes, time.perf_counter() - start)
+
+    def parallel_scores(self, b, lookahead, known=None):
+        """Return the same scores as scores_for, with each root column
+        searched in a separate worker of the shared process pool.
 
+        Scores are collected by column, so the result does not depend on
+        which worker finishes first. Raises SearchTimeout if an
+        iterative_scores deadline passes in any worker, or as soon as
+        cancel_event is set, stopping the jobs still running.
+        """
+        # imported here, like the pool itself: only parallel searches need it
+        from concurrent.futures import wait
+        if self._pickled_args is None:
+            self._pickled_args = pickle.dumps(self._args)
+        time_left = None
+        if self._deadline is not None:
+            time_left = max(0.0, self._deadline - time.perf_counter())
+        pool = parallel.get_pool(self.workers)
+        stop = parallel.new_stop_flag()
+        futures = {}
+        scores = [0] * b.width
+        for col in self.root_columns(b):
+            if not b.can_add_to(col):
+                scores[col] = -1
+            elif known is not None and known[col] in (0, 100):
+                scores[col] = known[col]
+            else:
+                futures[col] = pool.submit(parallel.search_column, self._pickled_args,
+                                           b, col, lookahead, time_left, stop)
+        pending = set(futures.values())
+        try:
+            while pending:
+                if self.cancel_event is not None and self.cancel_event.is_set():
+                    raise SearchTimeout()
+                pending = wait(pending, None if self.cancel_event is None else 0.05)[1]
+        finally:
+            if pending:
+                # abandoned: drop the jobs not started and stop the others
+                stop.set()
+                for future in pending:
+                    future.cancel()
+        for col, future in futures.items():
+            scores[col], stats = future.result()
+            self.stats.merge(stats)
+        if None in scores:
+            raise SearchTimeout()
+        return self.mirror_scores(b, scores)
+
+    def iterative_scores(self, b, time_budget):
+        """Return the scores for board b from the deepest search that finishes
+        within time_budget seconds.
+
+        Depths 1, 2, 3, ... are searched in turn; killers, history and the
+        transposition table carry over from one depth to the next, and
+        columns already proved won or lost are not searched again. Depth 1
+        always runs to completion. self.last_depth is left at the depth the
+        returned scores come from.
+        """
+        deadline = time.perf_counter() + time_budget
+        empty = b.width * b.height - b.moves
+        scores = self.scores_for(b, 1)
+        depth = 1
+        self._deadline = deadline
+        try:
+            while depth < empty and time.perf_counter() < deadline and \
+                  any(0 < score < 100 for score in scores):
+                scores = self.scores_for(b, depth + 1, scores)
+                depth += 1
+        except SearchTimeout:
+            pass
+        finally:
+            self._deadline = None
+        self.last_depth = self.stats.depth = depth
         return scores
 
-    def next_move(self, b):
-        """Overrides Player.next_move: return this AI's chosen column."""
-        self.num_moves += 1
-        return self.max_score_column(self.scores_for(b))
+    def forced_move(self, b, lookahead=2):
+        """Return the column to play on b without searching, or None: a
+        winning column if there is one (chosen by tiebreak), or else the
+        one column that stops the opponent winning at once. Only what a
+        search of lookahead moves would see is used, so a lookahead 1
+        player still does not block."""
+        tactics = b.tactics(self.checker)
+        if tactics['wins'] and lookahead >= 1:
+            return self.max_score_column([100 if c in tactics['wins'] else 0
+                                          for c in range(b.width)])
+        if len(tactics['blocks']) == 1 and lookahead >= 2:
+            return tactics['blocks'][0]
+        return None
+
+    def check_deadline(self):
+        """Count a search node and, every so often, call check_stop."""
+        self.nodes += 1
+        if self.nodes % 256 == 0:
+            self.check_stop()
 
+    def check_stop(self):
+        """Raise SearchTimeout if an iterative_scores deadline has passed
+        or cancel_event is set."""
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise SearchTimeout()
+
+    def next_move(self, b, time_budget=None):
+        """Overrides Player.next_move: return this AI's chosen column.
+
+        With a time_budget in seconds (or one given to the constructor) the
+        search deepens iteratively until the time is up instead of searching
+        to a fixed lookahead; self.last_depth reports the depth reached (0 when
+        the move came from the opening book). self.stats describes the search.
+        """
+        self.num_moves += 1
+        if time_budget is None:
+            time_budget = self.time_budget
+        if time_budget is None and self.algo != 'SOLVE':
+            col = self.forced_move(b, self.lookahead)
+        else:
+            col = self.forced_move(b)
+        if col is not None:
+            self.last_depth = 0
+            self.stats = SearchStats()
+            self.stats.forced = True
+            return col
+        scores = None
+        if self.book is not None:
+            scores = self.book.lookup(b, self.checker)
+        if scores is not None:
+            self.last_depth = 0
+            self.stats = SearchStats()
+            self.stats.book_hit = True
+        elif time_budget is None or self.algo == 'SOLVE':
+            scores = self.scores_for(b)
+        else:
+            scores = self.iterative_scores(b, time_budget)
+        return self.max_score_column(scores)
 
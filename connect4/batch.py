@@ -0,0 +1,95 @@
+"""
+ Vectorized operations on many Connect Four positions at once.
+
+ Positions are stacked in an (N, height, width) int8 NumPy array laid out
+ like Board.slots (row 0 at the top) holding 1 for 'X', -1 for 'O' and 0
+ for an empty slot. Requires NumPy (pip install numpy).
+"""
+
+import numpy as np
+
+from .evaluation import default_weights, window_values
+
+CODES = {'X': 1, 'O': -1, ' ': 0}
+
+
+def to_array(boards):
+    """ returns the (N, height, width) array for a list of Board objects
+        of the same size; an array passed in is returned as int8 """
+    if isinstance(boards, np.ndarray):
+        return boards.astype(np.int8, copy=False)
+    return np.array([[[CODES[slot] for slot in row] for row in b.slots]
+                     for b in boards], dtype=np.int8)
+
+
+def legal_moves(positions):
+    """ returns an (N, width) bool array: True where a checker can still
+        be added to the column """
+    positions = to_array(positions)
+    return positions[:, 0, :] == 0
+
+
+def line_length(positions, k=None):
+    """ returns how many in a row win for positions: the k of a list of
+        Board objects, which must all share one (and match k if given),
+        else k for an array (4 if None) """
+    if isinstance(positions, np.ndarray):
+        return 4 if k is None else k
+    ks = set(b.k for b in positions)
+    assert(len(ks) <= 1)
+    if not ks:
+        return 4 if k is None else k
+    assert(k is None or ks == {k})
+    return ks.pop()
+
+
+def _windows(mine, k=4):
+    """ returns a list of arrays, one per line direction, counting how many
+        of mine's slots are set in each k-slot window of every position """
+    n, h, w = mine.shape
+    m = mine.astype(np.int8)
+    counts = []
+    if w >= k:
+        counts.append(sum(m[:, :, i:w - k + 1 + i] for i in range(k)))
+    if h >= k:
+        counts.append(sum(m[:, i:h - k + 1 + i, :] for i in range(k)))
+    if w >= k and h >= k:
+        # down-right and up-right diagonals
+        counts.append(sum(m[:, i:h - k + 1 + i, i:w - k + 1 + i] for i in range(k)))
+        counts.append(sum(m[:, k - 1 - i:h - i, i:w - k + 1 + i] for i in range(k)))
+    return counts
+
+
+def wins(positions, checker, k=None):
+    """ returns an (N,) bool array: True where checker has k in a row;
+        k comes from the boards if positions is a list of Boards, and is
+        only needed with an array (4 if None) """
+    k = line_length(positions, k)
+    positions = to_array(positions)
+    mine = positions == CODES[checker]
+    result = np.zeros(len(positions), dtype=bool)
+    for counts in _windows(mine, k):
+        result |= (counts == k).reshape(len(positions), -1).any(axis=1)
+    return result
+
+
+def evaluate(positions, checker, weights=None, scale=64, k=None):
+    """ returns an (N,) float array with the WindowEvaluator score of every
+        position for checker: each k-slot window holding n of one side's
+        checkers and none of the other's is worth weights[n] to that side
+        (default_weights(k) if None). k is found as for wins """
+    k = line_length(positions, k)
+    positions = to_array(positions)
+    opp = 'O' if checker == 'X' else 'X'
+    if weights is None:
+        weights = default_weights(k)
+    table = np.array(window_values(weights, k), dtype=np.int64)
+    total = np.zeros(len(positions), dtype=np.int64)
+    mine_counts = _windows(positions == CODES[checker], k)
+    theirs_counts = _windows(positions == CODES[opp], k)
+    for a, b in zip(mine_counts, theirs_counts):
+        a = a.reshape(len(positions), -1)
+        b = b.reshape(len(positions), -1)
+        value = np.where(b == 0, table[a], 0) - np.where(a == 0, table[b], 0)
+        total += value.sum(axis=1)
+    return total / (np.abs(total) + scale)
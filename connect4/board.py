@@ -1,29 +1,133 @@
 
 """
- A Connect Four Board class
+ A Connect Four Board class, for boards of any size and any number k of
+ checkers in a row needed to win (4 by default)
 """
 
+import random
+
+# Zobrist keys per (height, width, k): one random 64-bit number for every
+# (checker, bit position). They come from a fixed seed so that the same
+# position hashes the same way in every process (and in a persistent
+# table), and differently under another k, where its value differs.
+_zobrist_tables = {}
+
+def zobrist_table(height, width, k=4):
+    """ returns the {'X': [...], 'O': [...]} Zobrist keys for a board size,
+        indexed by bit position; built once per size and shared """
+    key = (height, width, k)
+    if key not in _zobrist_tables:
+        seed = height * 1000 + width
+        if k != 4:
+            seed += k * 1000000
+        rng = random.Random(seed)
+        n = (height + 1) * width
+        _zobrist_tables[key] = {
+            'X': [rng.getrandbits(64) for i in range(n)],
+            'O': [rng.getrandbits(64) for i in range(n)],
+        }
+    return _zobrist_tables[key]
+
+
+# every k-in-a-row window of a board size as a bitmask, built once per
+# (height, width, k)
+_line_tables = {}
+
+def line_masks(height, width, k=4):
+    """ returns a tuple with one bitmask per group of k consecutive slots
+        (horizontal, vertical or diagonal) on a height x width board """
+    key = (height, width, k)
+    if key not in _line_tables:
+        stride = height + 1
+        masks = []
+        for col in range(width):
+            for r in range(height):
+                # right, up, up-right and down-right from slot (r, col)
+                for dc, dr in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                    if 0 <= col + (k - 1) * dc < width and 0 <= r + (k - 1) * dr < height:
+                        m = 0
+                        for i in range(k):
+                            m |= 1 << ((col + i * dc) * stride + r + i * dr)
+                        masks.append(m)
+        _line_tables[key] = tuple(masks)
+    return _line_tables[key]
+
+
+# (bottom row, all slots, one mask per column) of a board size
+_size_masks = {}
+
+def size_masks(height, width):
+    """ returns (bottom, full, columns): the bitmask of the bottom slot of
+        every column, of every slot, and a tuple of each column's slots """
+    key = (height, width)
+    if key not in _size_masks:
+        stride = height + 1
+        column = (1 << height) - 1
+        columns = tuple(column << (col * stride) for col in range(width))
+        bottom = 0
+        for col in range(width):
+            bottom |= 1 << (col * stride)
+        _size_masks[key] = (bottom, bottom * column, columns)
+    return _size_masks[key]
+
+
 class Board:
     """ a data type for a Connect Four board with arbitrary dimensions
-    """   
-        
-    def __init__(self, height, width):
-        """ constructs a new board object """
+
+        Each side's checkers are stored as an integer bitmask. Column col
+        owns bits col * (height + 1) up to col * (height + 1) + height - 1,
+        bottom row first; the extra bit on top of every column is always
+        empty so that shifted masks never wrap from one column into the next.
+        Python ints grow as needed, so the same code serves boards too big
+        for a 64-bit word; they are just slower.
+        The bitmasks and Zobrist hash of the position's mirror image (left
+        and right swapped) are kept up to date alongside, so symmetric
+        positions can share cache entries at no extra cost per lookup.
+        The number of checkers in each column is kept in a bytearray, so
+        columns may be at most 255 slots tall.
+    """
+
+    __slots__ = ('height', 'width', 'k', 'moves', 'hash', 'mirror_hash', '_bits',
+                 '_mirror', '_heights', '_slots', '_undo_stack', '_zobrist')
+
+    def __init__(self, height, width, k=4):
+        """ constructs a new board object on which k checkers in a row win """
+        assert(0 < height < 256)
+        assert(k >= 1)
         self.height = height
         self.width = width
-        self.slots = [[' '] * self.width for row in range(self.height)]
+        self.k = k
+        self._bits = {'X': 0, 'O': 0}
+        self._mirror = {'X': 0, 'O': 0}
+        self._heights = bytearray(width)
+        self._slots = None
+        self._undo_stack = []
+        self._zobrist = zobrist_table(height, width, k)
+        # Zobrist hashes of the position and of its mirror image, kept up
+        # to date on every move
+        self.hash = 0
+        self.mirror_hash = 0
+        # the number of checkers on the board
+        self.moves = 0
+
+    def __reduce__(self):
+        """ pickles a Board as its size and two bitmasks (the undo stack
+            is not kept), which is much smaller than the slots grid """
+        return (_unpickle_board, (self.height, self.width,
+                                  self._bits['X'], self._bits['O'], self.k))
 
     def __repr__(self):
         """ Returns a string that represents a Board object.
         """
         s = ''         #  begin with an empty string
+        slots = self.slots
 
         # add one row of slots at a time to s
         for row in range(self.height):
             s += '|'   # one vertical bar at the start of the row
 
             for col in range(self.width):
-                s += self.slots[row][col] + '|'
+                s += slots[row][col] + '|'
 
             s += '\n'  # newline at the end of the row
 
@@ -31,39 +135,90 @@ class Board:
         for i in range(loop_times):
             s += '-'
         s += '\n'
-        
+
         s += ' '
         for col in range(self.width):
             col %= 10
             s += (str(col) + ' ')
-        s += '\n'        
+        s += '\n'
         return s
 
+    @property
+    def slots(self):
+        """ a list of lists of ' '/'X'/'O' strings with row 0 at the top;
+            built lazily from the bitmasks and cached until the next move.
+            It is a read-only view: assign a whole new grid to change it.
+        """
+        if self._slots is None:
+            stride = self.height + 1
+            x_bits = self._bits['X']
+            o_bits = self._bits['O']
+            slots = [[' '] * self.width for row in range(self.height)]
+            for col in range(self.width):
+                for r in range(self._heights[col]):
+                    bit = 1 << (col * stride + r)
+                    if x_bits & bit:
+                        slots[self.height - 1 - r][col] = 'X'
+                    elif o_bits & bit:
+                        slots[self.height - 1 - r][col] = 'O'
+            self._slots = slots
+        return self._slots
+
+    @slots.setter
+    def slots(self, grid):
+        """ rebuilds the bitmasks from a list of lists of ' '/'X'/'O' """
+        self.reset()
+        for col in range(self.width):
+            for row in range(self.height - 1, -1, -1):
+                checker = grid[row][col]
+                if checker == ' ':
+                    break
+                self.add_checker(checker, col)
+
     def add_checker(self, checker, col):
         """ adds the specified checker (either 'X' or 'O') to the
             column with the specified index col in the called Board.
             inputs: checker is either 'X' or 'O'
                     col is a valid column index
+            returns the row (0 at the top, as in slots) the checker
+            landed in, or None if the column was already full
         """
         assert(checker == 'X' or checker == 'O')
         assert(col >= 0 and col < self.width)
-        
-        for row in range(self.height):
-            if (self.slots[self.height - 1 - row][col] == ' '): # start at bottom row
-                self.slots[self.height - 1 - row][col] = checker          
-                break
+
+        r = self._heights[col]
+        if r < self.height:
+            stride = self.height + 1
+            pos = col * stride + r
+            mirror_pos = (self.width - 1 - col) * stride + r
+            self._bits[checker] |= 1 << pos
+            self._mirror[checker] |= 1 << mirror_pos
+            self._heights[col] = r + 1
+            self.moves += 1
+            zobrist = self._zobrist[checker]
+            self.hash ^= zobrist[pos]
+            self.mirror_hash ^= zobrist[mirror_pos]
+            self._slots = None
+            return self.height - 1 - r
+        return None
 
     def reset(self):
         """ resets the Board object by setting all slots to empty """
-        for row in range(self.height):
-            for col in range(self.width):
-                self.slots[row][col] = ' '
-    
+        self._bits = {'X': 0, 'O': 0}
+        self._mirror = {'X': 0, 'O': 0}
+        self._heights = bytearray(self.width)
+        self._slots = None
+        self._undo_stack = []
+        self.hash = 0
+        self.mirror_hash = 0
+        self.moves = 0
+
     def add_checkers(self, colnums):
         """ takes a string of column numbers and places alternating
             checkers in those columns of the called Board object,
             starting with 'X'.
-            input: colnums is a string of valid column numbers
+            input: colnums is a string of valid column numbers, or a
+                   list of ints (for boards more than 10 columns wide)
         """
         checker = 'X'   # start by playing 'X'
 
@@ -76,112 +231,271 @@ class Board:
                 checker = 'O'
             else:
                 checker = 'X'
-    
+
     def can_add_to(self, col):
         """ returns True/False whether checker can be added to column col """
         if (col < 0 or col > self.width - 1):
             return False
-        for row in range(self.height):
-            if self.slots[row][col] == ' ':
-                return True
-        return False
-        
+        return self._heights[col] < self.height
+
     def is_full(self):
         """ returns True/False whether Board object is all full of checkers """
-        for col in range(self.width):
-            if self.can_add_to(col):
-                return False
-        return True
-        
+        return self.moves == self.height * self.width
+
     def remove_checker(self, col):
         """Remove the top checker from column col (if any)."""
         # column empty? nothing to do
-        # The bottom slot is at index self.height - 1. If it's empty,
-        # the column has no checkers.
-        if self.slots[self.height - 1][col] == ' ':
+        r = self._heights[col]
+        if r == 0:
             return
-        # remove the first non-empty from the top (the highest occupied slot)
-        for row in range(self.height):
-            if self.slots[row][col] != ' ':
-                self.slots[row][col] = ' '
-                return
- 
+        stride = self.height + 1
+        pos = col * stride + r - 1
+        mirror_pos = (self.width - 1 - col) * stride + r - 1
+        bit = 1 << pos
+        checker = 'X' if self._bits['X'] & bit else 'O'
+        self._bits[checker] &= ~bit
+        self._mirror[checker] &= ~(1 << mirror_pos)
+        self._heights[col] = r - 1
+        self.moves -= 1
+        zobrist = self._zobrist[checker]
+        self.hash ^= zobrist[pos]
+        self.mirror_hash ^= zobrist[mirror_pos]
+        self._slots = None
+
+    def play(self, checker, col):
+        """ like add_checker, but also records col on the undo stack so
+            that undo() can take the move back; returns the landing row.
+            col must not be full.
+        """
+        row = self.add_checker(checker, col)
+        self._undo_stack.append(col)
+        return row
+
+    def undo(self):
+        """ takes back the most recent move made with play() and returns
+            its column """
+        col = self._undo_stack.pop()
+        self.remove_checker(col)
+        return col
+
+    def bitboard(self, checker):
+        """ returns the bitmask of the slots holding checker """
+        return self._bits[checker]
+
+    def key(self):
+        """ returns an int that identifies the position uniquely: per
+            column, the 'X' bits plus a run of 1s as tall as the column.
+            It fits in (height + 1) * width bits, 49 for a 6x7 board.
+        """
+        return self._bits['X'] + (self._bits['X'] | self._bits['O'])
+
+    def mirror_key(self):
+        """ returns key() of this position reflected left to right """
+        return self._mirror['X'] + (self._mirror['X'] | self._mirror['O'])
+
+    def is_symmetric(self):
+        """ returns True/False whether the position is its own mirror image """
+        return self._bits == self._mirror
+
+    def canonical_hash(self):
+        """ returns (h, mirrored): the smaller of the position's Zobrist hash
+            and its mirror image's, and whether that is the mirror image's.
+            A cache keyed by h holds one entry for a position and its mirror
+            image; columns stored with it must be flipped when mirrored. """
+        if self.mirror_hash < self.hash:
+            return self.mirror_hash, True
+        return self.hash, False
+
+    def lines(self):
+        """ returns the bitmasks of every k-in-a-row window on this board """
+        return line_masks(self.height, self.width, self.k)
+
+    def playable(self):
+        """ returns the bitmask of the slots a checker can be dropped into """
+        bottom, full, columns = size_masks(self.height, self.width)
+        return ((self._bits['X'] | self._bits['O']) + bottom) & full
+
+    def threats(self, checker):
+        """ returns the bitmask of the empty slots, playable now or not,
+            that would complete k in a row for checker """
+        bits = self._bits[checker]
+        empty = size_masks(self.height, self.width)[1] & ~(bits | self._bits['O' if checker == 'X' else 'X'])
+        if self.k != 4:
+            # a window with every slot but one of checker's, that one empty
+            r = 0
+            for m in self.lines():
+                missing = m & ~bits
+                if missing & empty and not missing & (missing - 1):
+                    r |= missing
+            return r
+        h = self.height
+        # vertical: three below
+        r = (bits << 1) & (bits << 2) & (bits << 3)
+        # the other directions: three on one side, or two and one
+        for s in (h + 1, h, h + 2):
+            p = (bits << s) & (bits << 2 * s)
+            r |= p & (bits << 3 * s)
+            r |= p & (bits >> s)
+            p = (bits >> s) & (bits >> 2 * s)
+            r |= p & (bits << s)
+            r |= p & (bits >> 3 * s)
+        return r & empty
+
+    def safe_moves(self, checker):
+        """ returns the bitmask of playable slots after which the opponent
+            cannot win straight away: only the block if the opponent has
+            one playable winning slot, none if it has two, and never the
+            slot under an opponent's winning slot. checker is assumed not
+            to have a winning move itself. """
+        playable = self.playable()
+        opponent = self.threats('O' if checker == 'X' else 'X')
+        forced = playable & opponent
+        if forced:
+            if forced & (forced - 1):
+                return 0
+            playable = forced
+        return playable & ~(opponent >> 1)
+
+    def columns_of(self, mask):
+        """ returns the list of columns, left to right, holding bits of mask """
+        columns = size_masks(self.height, self.width)[2]
+        return [col for col in range(self.width) if mask & columns[col]]
+
+    def tactics(self, checker):
+        """ returns a dict describing the position for checker to move:
+            'wins', the columns that win at once; 'blocks', the columns
+            where the opponent would win at once (checker must play there
+            unless it can win); 'losing', the columns that let the opponent
+            win on top of checker's move; and 'odd_threats'/'even_threats',
+            how many of checker's winning slots that cannot be played yet
+            lie on odd/even rows counted from 1 at the bottom. The first
+            player ('X' when X starts) is usually helped by odd threats at
+            the end of a game, the second by even ones.
+        """
+        opponent = 'O' if checker == 'X' else 'X'
+        playable = self.playable()
+        mine = self.threats(checker)
+        theirs = self.threats(opponent)
+        pending = mine & ~playable
+        stride = self.height + 1
+        odd = 0
+        while pending:
+            low = pending & -pending
+            if ((low.bit_length() - 1) % stride) % 2 == 0:
+                odd += 1
+            pending ^= low
+        return {
+            'wins': self.columns_of(mine & playable),
+            'blocks': self.columns_of(theirs & playable),
+            'losing': self.columns_of(playable & (theirs >> 1)),
+            'odd_threats': odd,
+            'even_threats': bin(mine & ~playable).count('1') - odd,
+        }
+
+    def _has_four(self, bits, shift):
+        """ returns True/False whether bits has k in a row along the
+            direction that moves shift bit positions per step
+        """
+        # after each step, m marks the starts of runs at least n long;
+        # doubling n takes log2(k) steps, and one more covers the rest
+        k = self.k
+        m = bits
+        n = 1
+        while 2 * n <= k:
+            m &= m >> (n * shift)
+            n *= 2
+        if n < k:
+            m &= m >> ((k - n) * shift)
+        return m != 0
+
     def is_win_for(self, checker):
-        """ returns True/False whether 4 consecutive slots contain checker """
+        """ returns True/False whether k consecutive slots contain checker """
         assert(checker == 'X' or checker == 'O')
         # call the helper functions and use their return values to
-        # determine whether to return True or False  
+        # determine whether to return True or False
         return self.is_horizontal_win(checker) or \
                self.is_vertical_win(checker) or \
                self.is_down_diagonal_win(checker) or \
-               self.is_up_diagonal_win(checker)                            
-        
+               self.is_up_diagonal_win(checker)
+
+    def is_win_at(self, row, col):
+        """ returns True/False whether the checker in slot (row, col) is
+            part of k consecutive slots; only the four lines through that
+            slot are looked at, so this is the cheap check after a move
+        """
+        bit = 1 << (col * (self.height + 1) + self.height - 1 - row)
+        if self._bits['X'] & bit:
+            bits = self._bits['X']
+        elif self._bits['O'] & bit:
+            bits = self._bits['O']
+        else:
+            return False
+
+        for shift in (1, self.height, self.height + 1, self.height + 2):
+            count = 1
+            # walk away from the slot in both directions along the line
+            # (the empty top bit of each column stops walks at the edges)
+            b = bit >> shift
+            while bits & b:
+                count += 1
+                b >>= shift
+            b = bit << shift
+            while bits & b:
+                count += 1
+                b <<= shift
+            if count >= self.k:
+                return True
+        return False
+
     def is_horizontal_win(self, checker):
         """ Checks for a horizontal win for the specified checker.
         """
-        for row in range(self.height):
-            for col in range(self.width - 3):
-                # Check if the next four columns in this row
-                # contain the specified checker.
-                if self.slots[row][col] == checker and \
-                   self.slots[row][col + 1] == checker and \
-                   self.slots[row][col + 2] == checker and \
-                   self.slots[row][col + 3] == checker:
-                    return True
-    
-        # if we make it here, there were no horizontal wins
-        return False
-    
+        return self._has_four(self._bits[checker], self.height + 1)
+
     def is_vertical_win(self, checker):
         """ Checks for a vertical win for the specified checker.
         """
-        for row in range(self.height - 3):
-            for col in range(self.width):
-                if self.slots[row][col] == checker and \
-                   self.slots[row + 1][col] == checker and \
-                   self.slots[row + 2][col] == checker and \
-                   self.slots[row + 3][col] == checker:
-                       return True
-        return False
-    
+        return self._has_four(self._bits[checker], 1)
+
     def is_down_diagonal_win(self, checker):
         """ Checks for a down diagonal win for the specified checker """
-        for row in range(self.height - 3):
-            for col in range(self.width - 3):
-                if self.slots[row][col] == checker and \
-                   self.slots[row +1][col + 1] == checker and \
-                   self.slots[row + 2][col + 2] == checker and \
-                   self.slots[row + 3][col + 3] == checker:
-                       return True
-        return False
-    
+        return self._has_four(self._bits[checker], self.height)
+
     def is_up_diagonal_win(self, checker):
         """ Checks for a up diagonal win for the specified checker """
-        for row in range(self.height - 3):
-            for col in range(self.width - 3):
-                if self.slots[self.height - 1 - row][col] == checker and \
-                   self.slots[self.height - 2 - row][col + 1] == checker and \
-                   self.slots[self.height - 3 - row][col + 2] == checker and \
-                   self.slots[self.height - 4 - row][col + 3] == checker:
-                       return True
-        return False
-        
+        return self._has_four(self._bits[checker], self.height + 2)
+
     def copy(self):
-        b2 = Board(self.height, self.width)
-        b2.slots = [row[:] for row in self.slots]
+        """ returns a new Board with the same checkers and undo stack """
+        # filled in directly rather than through __init__, as the search
+        # copies boards often
+        b2 = Board.__new__(Board)
+        b2.height = self.height
+        b2.width = self.width
+        b2.k = self.k
+        b2.moves = self.moves
+        b2.hash = self.hash
+        b2._bits = self._bits.copy()
+        b2._mirror = self._mirror.copy()
+        b2.mirror_hash = self.mirror_hash
+        b2._heights = self._heights[:]
+        b2._slots = None
+        b2._undo_stack = self._undo_stack[:]
+        b2._zobrist = self._zobrist
         return b2
 
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
\ No newline at end of file
+
+def _unpickle_board(height, width, x_bits, o_bits, k=4):
+    """ rebuilds a Board pickled by Board.__reduce__ """
+    b = Board(height, width, k)
+    stride = height + 1
+    for col in range(width):
+        for r in range(height):
+            bit = 1 << (col * stride + r)
+            if x_bits & bit:
+                b.add_checker('X', col)
+            elif o_bits & bit:
+                b.add_checker('O', col)
+            else:
+                break
+    return b
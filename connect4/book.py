@@ -0,0 +1,191 @@
+"""
+ An opening book: precomputed column scores for the first plies of a game,
+ stored in a sorted binary file that is searched in place through mmap.
+
+ Build one with
+     python -m connect4.book out.book --plies 6 --lookahead 8
+"""
+
+import argparse
+import mmap
+import struct
+
+from .board import Board
+
+MAGIC = b'C4BK'
+VERSION = 1
+# magic, version, height, width, plies, number of records
+HEADER = struct.Struct('<4sBBBBI')
+
+
+def side_to_move(board):
+    """ returns the checker whose turn it is, assuming 'X' moved first """
+    return 'X' if board.moves % 2 == 0 else 'O'
+
+
+def canonical_key(board):
+    """ returns (key, mirrored): the smaller of the position's key and its
+        mirror image's key, and whether that is the mirror image """
+    key = board.key()
+    mirror = board.mirror_key()
+    if mirror < key:
+        return mirror, True
+    return key, False
+
+
+class OpeningBook:
+    """ a read-only opening book file. Records are (key, scores) with the
+        keys sorted, so a lookup is a binary search over the mapped file and
+        nothing is parsed when the book is opened.
+    """
+
+    def __init__(self, path):
+        """ opens the book at path """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, height, width, plies, count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(path + ' is not a connect4 opening book')
+        self.height = height
+        self.width = width
+        self.plies = plies
+        self.count = count
+        self._record = struct.Struct('<Q' + str(width) + 'b')
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        """ returns a string describing the book """
+        return "OpeningBook(" + self.path + ", " + str(self.height) + "x" + \
+               str(self.width) + ", " + str(self.plies) + " plies, " + \
+               str(self.count) + " positions)"
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """ releases the mapping and the file """
+        self._mm.close()
+        self._file.close()
+
+    def _find(self, key):
+        """ returns the scores stored under key, or None """
+        lo = 0
+        hi = self.count
+        size = self._record.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = struct.unpack_from('<Q', self._mm, HEADER.size + mid * size)[0]
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return list(self._record.unpack_from(self._mm, HEADER.size + mid * size)[1:])
+        return None
+
+    def lookup(self, board, checker):
+        """ returns the list of column scores (0..100, -1 for a full column)
+            for checker to move on board, or None if the book does not have
+            the position or it is not checker's turn. Books are built
+            for 4 in a row only.
+        """
+        if board.height != self.height or board.width != self.width or \
+           board.k != 4 or side_to_move(board) != checker:
+            self.misses += 1
+            return None
+        key, mirrored = canonical_key(board)
+        scores = self._find(key)
+        if scores is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if mirrored:
+            scores.reverse()
+        return scores
+
+
+def book_positions(height, width, plies):
+    """ returns one Board for every position, up to mirror images, that can
+        arise in the first plies moves of a game and is not already over """
+    positions = {}
+    frontier = [Board(height, width)]
+    positions[canonical_key(frontier[0])[0]] = frontier[0]
+    for ply in range(plies):
+        checker = 'X' if ply % 2 == 0 else 'O'
+        next_frontier = []
+        for b in frontier:
+            for col in range(width):
+                if not b.can_add_to(col):
+                    continue
+                child = b.copy()
+                row = child.add_checker(checker, col)
+                if child.is_win_at(row, col) or child.is_full():
+                    continue
+                key = canonical_key(child)[0]
+                if key not in positions:
+                    positions[key] = child
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+
+def build_book(path, height=6, width=7, plies=6, make_player=None, progress=None):
+    """ searches every position of the first plies moves and writes the
+        book to path. make_player(checker) returns the AIPlayer used to score
+        a position for checker; the default is a depth-8 ALPHABETA search
+        with the window evaluator. Returns the number of positions written.
+    """
+    assert((height + 1) * width <= 64)
+    if make_player is None:
+        from .ai_player import AIPlayer
+
+        def make_player(checker):
+            return AIPlayer(checker, 'LEFT', 8, 'ALPHABETA', tt_size=1 << 18,
+                            evaluator='WINDOWS')
+    players = {'X': make_player('X'), 'O': make_player('O')}
+    positions = book_positions(height, width, plies)
+    record = struct.Struct('<Q' + str(width) + 'b')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, height, width, plies, len(positions)))
+        for n, key in enumerate(sorted(positions)):
+            b = positions[key]
+            scores = players[side_to_move(b)].scores_for(b)
+            if b.key() != key:
+                scores.reverse()
+            f.write(record.pack(key, *scores))
+            if progress is not None:
+                progress(n + 1, len(positions))
+    return len(positions)
+
+
+def main(argv=None):
+    """ command line entry point for building a book """
+    parser = argparse.ArgumentParser(description='Build a Connect Four opening book.')
+    parser.add_argument('path', help='file to write')
+    parser.add_argument('--height', type=int, default=6)
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--plies', type=int, default=6)
+    parser.add_argument('--lookahead', type=int, default=8)
+    parser.add_argument('--algo', default='ALPHABETA')
+    parser.add_argument('--evaluator', default='WINDOWS')
+    args = parser.parse_args(argv)
+
+    from .ai_player import AIPlayer
+
+    def make_player(checker):
+        return AIPlayer(checker, 'LEFT', args.lookahead, args.algo,
+                        tt_size=1 << 18, evaluator=args.evaluator)
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(str(done) + '/' + str(total) + ' positions', flush=True)
+
+    n = build_book(args.path, args.height, args.width, args.plies, make_player, progress)
+    print('wrote', n, 'positions to', args.path)
+
+
+if __name__ == '__main__':
+    main()
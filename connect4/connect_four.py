@@ -6,13 +6,16 @@ from .board import Board
 from .player import Player
 import random
     
-def connect_four(p1, p2):
+def connect_four(p1, p2, quiet=False, height=6, width=7, k=4):
     """ Plays a game of Connect Four between the two specified players,
         and returns the Board object as it looks at the end of the game.
         inputs: p1 and p2 are objects representing Connect Four
           players (objects of the class Player or a subclass of Player).
           One player should use 'X' checkers and the other player should
           use 'O' checkers.
+          quiet=True plays the game without printing anything.
+          height, width and k give the board size and how many checkers
+          in a row win.
     """
     # Make sure one player is 'X' and one player is 'O'.
     if p1.checker not in 'XO' or p2.checker not in 'XO' \
@@ -20,31 +23,38 @@ def connect_four(p1, p2):
         print('need one X player and one O player.')
         return None
 
-    print('Welcome to Connect Four!')
-    print()
-    b = Board(6, 7)
-    print(b)
+    b = Board(height, width, k)
+    if not quiet:
+        print('Welcome to Connect Four!')
+        print()
+        print(b)
     
     while True:
-        if process_move(p1, b) == True:
+        if process_move(p1, b, quiet) == True:
             return b
 
-        if process_move(p2, b) == True:
+        if process_move(p2, b, quiet) == True:
             return b
 
-def process_move(p, b):
-    """ process a single move by player p on board b """
-    print(str(p) + "'s turn")
-    print()
+def process_move(p, b, quiet=False):
+    """ process a single move by player p on board b;
+        quiet=True skips printing the board and the result
+    """
+    if not quiet:
+        print(str(p) + "'s turn")
+        print()
     col = p.next_move(b) # column number for next move
-    b.add_checker(p.checker, col)
-    print()
-    print(b)
-    if b.is_win_for(p.checker):
-        print(str(p) + " wins in", p.num_moves, "moves\nCongratulations!")
+    row = b.add_checker(p.checker, col)
+    if not quiet:
+        print()
+        print(b)
+    if b.is_win_at(row, col):
+        if not quiet:
+            print(str(p) + " wins in", p.num_moves, "moves\nCongratulations!")
         return True
     elif b.is_full():
-        print("It's a tie!")
+        if not quiet:
+            print("It's a tie!")
         return True
     return False
         
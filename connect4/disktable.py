@@ -0,0 +1,199 @@
+"""
+ A transposition table kept in a memory-mapped file, shared by every
+ process that opens it and kept from one run to the next.
+
+ The file is a small header followed by a fixed number of 24-byte entries
+ in buckets of four: a position may go in any slot of the bucket its key
+ picks, so up to four positions that collide on the bucket are kept at
+ once, and past that the shallowest result makes way. Processes read and
+ write entries without locks. Each entry stores its key XORed with its
+ other two words, so an entry torn by two processes writing it at once no
+ longer matches any key and reads as a miss rather than as a wrong result.
+
+     table = DiskTable('positions.c4tt', 1 << 22)
+     AIPlayer('X', 'LEFT', 8, 'ALPHABETA', cache='positions.c4tt')
+"""
+
+import mmap
+import os
+import struct
+
+from .transposition import EMPTY
+
+try:
+    import fcntl
+except ImportError:     # Windows: files are then created without a lock
+    fcntl = None
+
+MAGIC = b'C4TT'
+VERSION = 1
+HEADER = struct.Struct('<4sBxxxQ')
+HEADER_SIZE = 64
+ENTRY = struct.Struct('<QdQ')
+BUCKET = 4
+
+_MASK64 = (1 << 64) - 1
+
+
+def _double_bits(value):
+    """ returns the 64-bit pattern of a float """
+    return struct.unpack('<Q', struct.pack('<d', value))[0]
+
+
+class DiskTable:
+    """ a fixed-size hash table of search results keyed by a 64-bit hash,
+        held in the file path, with the same probe/store interface as
+        TranspositionTable. salt is XORed into every key, so that players
+        whose values mean different things can share one file.
+    """
+
+    def __init__(self, path, size=1 << 20, policy='DEPTH', salt=0):
+        """ opens the table in path, creating it with room for size entries
+            (rounded up to a power of two, at least one bucket) if it does
+            not exist; an existing file keeps the size it was made with.
+            policy is as for TranspositionTable, and is applied within a
+            bucket once it is full.
+        """
+        assert(size > 0)
+        assert(policy == 'DEPTH' or policy == 'ALWAYS')
+        n = BUCKET
+        while n < size:
+            n *= 2
+        self.path = path
+        self.policy = policy
+        self.salt = salt & _MASK64
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                length = os.fstat(fd).st_size
+                if length == 0:
+                    os.ftruncate(fd, HEADER_SIZE + n * ENTRY.size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, VERSION, n), 0)
+                    length = HEADER_SIZE + n * ENTRY.size
+                magic, version, n = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or version != VERSION or \
+                   length != HEADER_SIZE + n * ENTRY.size or n < BUCKET or n & (n - 1):
+                    raise ValueError(path + ' is not a connect4 table file')
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self._mm = mmap.mmap(fd, length)
+        finally:
+            os.close(fd)
+        self.size = n
+        self._bucket_mask = n // BUCKET - 1
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def __repr__(self):
+        """ returns a string summarizing the table and its counters """
+        return "DiskTable(" + self.path + ", " + str(self.size) + ", " + self.policy + \
+               ", hits=" + str(self.hits) + ", misses=" + str(self.misses) + \
+               ", collisions=" + str(self.collisions) + ")"
+
+    def __len__(self):
+        """ returns the number of occupied slots """
+        unpack = ENTRY.unpack_from
+        mm = self._mm
+        return sum(1 for i in range(self.size)
+                   if unpack(mm, HEADER_SIZE + i * ENTRY.size)[2] >> 8 & 0xFF != EMPTY)
+
+    def __getstate__(self):
+        """ pickles as the path and settings: the copy maps the same file """
+        return (self.path, self.size, self.policy, self.salt)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _slots(self, key):
+        """ returns the file offset of the first slot of key's bucket """
+        return HEADER_SIZE + (key & self._bucket_mask) * BUCKET * ENTRY.size
+
+    def probe(self, key):
+        """ returns (depth, value, flag, move) stored for key, or None.
+            A full bucket without key counts as a collision.
+        """
+        key = (key ^ self.salt) & _MASK64
+        offset = self._slots(key)
+        mm = self._mm
+        full = True
+        for i in range(BUCKET):
+            check, value, data = ENTRY.unpack_from(mm, offset + i * ENTRY.size)
+            flag = data >> 8 & 0xFF
+            if flag == EMPTY:
+                full = False
+            elif check ^ data ^ _double_bits(value) == key:
+                self.hits += 1
+                return ((data & 0xFF) - 128, value, flag, (data >> 16 & 0xFF) - 1)
+        if full:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag, move=-1):
+        """ records a search result for key in its bucket: over its own
+            entry, else in an empty slot, else over the shallowest entry
+            (with the 'DEPTH' policy, only if that is no deeper)
+        """
+        key = (key ^ self.salt) & _MASK64
+        offset = self._slots(key)
+        mm = self._mm
+        victim = None
+        victim_depth = 128
+        for i in range(BUCKET):
+            slot = offset + i * ENTRY.size
+            check, old_value, data = ENTRY.unpack_from(mm, slot)
+            if data >> 8 & 0xFF == EMPTY:
+                if victim_depth >= 0:
+                    victim, victim_depth = slot, -1
+                continue
+            if check ^ data ^ _double_bits(old_value) == key:
+                victim, victim_depth = slot, -2
+                break
+            old_depth = (data & 0xFF) - 128
+            if old_depth < victim_depth:
+                victim, victim_depth = slot, old_depth
+        if self.policy == 'DEPTH' and victim_depth > depth:
+            return
+        data = (max(-128, min(depth, 127)) + 128) | flag << 8 | (move + 1) << 16
+        ENTRY.pack_into(mm, victim, key ^ data ^ _double_bits(value), value, data)
+        self.stores += 1
+
+    def clear(self):
+        """ empties the table, for every process using it, and resets the
+            counters """
+        self._mm[HEADER_SIZE:] = bytes(self.size * ENTRY.size)
+        self.hits = self.misses = self.collisions = self.stores = 0
+
+    def flush(self):
+        """ writes the table out to its file """
+        self._mm.flush()
+
+    def close(self):
+        """ flushes and unmaps the table """
+        if not self._mm.closed:
+            self._mm.flush()
+            self._mm.close()
+
+    def stats(self):
+        """ returns a dict of the table's counters """
+        probes = self.hits + self.misses
+        return {
+            'size': self.size,
+            'used': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'hit_rate': self.hits / probes if probes else 0.0,
+        }
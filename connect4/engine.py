@@ -0,0 +1,291 @@
+"""
+ A headless engine driven by a line-based text protocol on stdin/stdout,
+ for harnesses and other programs to play through:
+
+     python -m connect4
+
+ One process serves any number of games, and keeps its AIPlayers (with
+ their transposition tables and move ordering) from one game to the next.
+ Commands, one per line:
+
+     newgame [HEIGHT WIDTH [K]]   an empty board, 6x7 and 4 in a row unless given
+     position [MOVES...]          the empty board plus MOVES, the columns
+                                  played with 'X' first (space separated,
+                                  or one string of digits on boards up to
+                                  10 wide)
+     play COL                     plays one more move on the position
+     set NAME VALUE               algo, lookahead, time (seconds or none),
+                                  evaluator, ordering, tiebreak, tt_size,
+                                  tt_policy, workers, book or cache
+     go [depth N | time SECONDS]  searches the move for the side to move,
+                                  answering 'info ...' then 'bestmove COL'
+     stop                         ends the search early: the reply comes
+                                  from the deepest search finished
+     isready                      answers 'readyok'
+     stats                        answers 'stats' and the last search's
+                                  counters as JSON
+     quit
+
+ Anything wrong is answered with 'error' and a message. While a search
+ runs, stop, isready and quit are carried out at once (quit stops the
+ search); any other command waits for the search to finish, so a script
+ of commands can be piped in without waiting for each reply.
+"""
+
+import argparse
+import json
+import sys
+import threading
+
+from .board import Board
+from .ai_player import AIPlayer, SearchTimeout
+
+# the AIPlayer keyword arguments set can change, and how to read them
+OPTIONS = {
+    'algo': str,
+    'lookahead': int,
+    'time': float,
+    'evaluator': str,
+    'ordering': str,
+    'tiebreak': str,
+    'tt_size': int,
+    'tt_policy': str,
+    'workers': int,
+    'book': str,
+    'cache': str,
+}
+
+# options that can be changed on an existing player without rebuilding it
+SEARCH_OPTIONS = ('lookahead', 'time')
+
+
+class EngineError(Exception):
+    """ a command that cannot be carried out; its text is sent back """
+
+
+class Engine:
+    """ the engine's state: the position, the options and the players built
+        so far. Replies are written to out, a line at a time. """
+
+    def __init__(self, out=None):
+        """ constructs an Engine on an empty 6x7 board """
+        self.out = out if out is not None else sys.stdout
+        self.options = {'algo': 'ALPHABETA', 'lookahead': 6, 'time': None,
+                        'evaluator': 'WINDOWS', 'ordering': 'HEURISTIC',
+                        'tiebreak': 'LEFT', 'tt_size': 1 << 20, 'tt_policy': 'DEPTH',
+                        'workers': 0, 'book': None, 'cache': None}
+        self.board = Board(6, 7)
+        # (checker, options) -> AIPlayer, kept for the life of the engine
+        self.players = {}
+        self.last = None
+        self._lock = threading.Lock()
+        self._search = None
+        self._cancel = None
+
+    def __repr__(self):
+        """ returns a string representing an Engine object """
+        return "Engine(" + str(len(self.players)) + " players, " + \
+               str(self.board.moves) + " moves played)"
+
+    def send(self, line):
+        """ writes one reply line """
+        with self._lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def handle(self, line):
+        """ carries out one command line; returns False after quit """
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == 'quit':
+            self.stop()
+            return False
+        try:
+            handler = getattr(self, 'cmd_' + command, None)
+            if handler is None:
+                raise EngineError('unknown command ' + command)
+            if command not in ('stop', 'isready') and self._search is not None:
+                self._search.join()
+            handler(args)
+        except EngineError as e:
+            self.send('error ' + str(e))
+        return True
+
+    def player(self, checker):
+        """ returns the AIPlayer for checker with the current options,
+            building it the first time """
+        options = self.options
+        key = (checker,) + tuple(options[name] for name in sorted(options)
+                                 if name not in SEARCH_OPTIONS)
+        ai = self.players.get(key)
+        if ai is None:
+            try:
+                ai = AIPlayer(checker, options['tiebreak'], options['lookahead'],
+                              options['algo'], tt_size=options['tt_size'],
+                              tt_policy=options['tt_policy'], ordering=options['ordering'],
+                              evaluator=options['evaluator'], workers=options['workers'],
+                              book=options['book'], cache=options['cache'])
+            except (AssertionError, OSError, ValueError) as e:
+                raise EngineError('cannot build the player: ' + (str(e) or 'bad option'))
+            self.players[key] = ai
+        ai.lookahead = options['lookahead']
+        return ai
+
+    def cmd_newgame(self, args):
+        if len(args) not in (0, 2, 3):
+            raise EngineError('usage: newgame [HEIGHT WIDTH [K]]')
+        try:
+            size = [int(a) for a in args] or [6, 7]
+        except ValueError:
+            raise EngineError('usage: newgame [HEIGHT WIDTH [K]]')
+        if not all(0 < n < 64 for n in size):
+            raise EngineError('sizes must be from 1 to 63')
+        self.board = Board(*size)
+
+    def cmd_position(self, args):
+        b = self.board
+        if len(args) == 1 and b.width <= 10 and len(args[0]) > 1:
+            args = list(args[0])
+        board = Board(b.height, b.width, b.k)
+        for arg in args:
+            self.play_on(board, arg)
+        self.board = board
+
+    def cmd_play(self, args):
+        if len(args) != 1:
+            raise EngineError('usage: play COL')
+        self.play_on(self.board, args[0])
+
+    def play_on(self, board, arg):
+        """ plays the column arg (a string) on board for the side to move """
+        if board.is_full() or self.winner(board) is not None:
+            raise EngineError('the game is over')
+        try:
+            col = int(arg)
+        except ValueError:
+            raise EngineError('bad column ' + arg)
+        if not board.can_add_to(col):
+            raise EngineError('illegal move ' + arg)
+        board.add_checker('XO'[board.moves % 2], col)
+
+    def winner(self, board):
+        """ returns the checker that has won on board, or None """
+        for checker in 'XO':
+            if board.is_win_for(checker):
+                return checker
+        return None
+
+    def cmd_set(self, args):
+        if len(args) != 2 or args[0] not in OPTIONS:
+            raise EngineError('usage: set NAME VALUE, NAME one of ' + ' '.join(OPTIONS))
+        name, value = args
+        if value.lower() == 'none':
+            if name not in ('time', 'book', 'cache'):
+                raise EngineError(name + ' cannot be none')
+            self.options[name] = None
+            return
+        try:
+            value = OPTIONS[name](value)
+            # a negative lookahead would never reach the bottom of the search
+            if name in ('lookahead', 'tt_size', 'workers') and value < 0 or \
+               name == 'time' and not value > 0:
+                raise ValueError
+        except ValueError:
+            raise EngineError('bad value for ' + name)
+        if name in ('algo', 'evaluator', 'ordering', 'tiebreak', 'tt_policy'):
+            value = value.upper()
+        self.options[name] = value
+
+    def cmd_go(self, args):
+        b = self.board
+        if b.is_full() or self.winner(b) is not None:
+            raise EngineError('the game is over')
+        time_budget = self.options['time']
+        lookahead = None
+        if args:
+            try:
+                if len(args) != 2 or args[0] not in ('depth', 'time'):
+                    raise ValueError
+                if args[0] == 'depth':
+                    lookahead = int(args[1])
+                    time_budget = None
+                    if lookahead < 0:
+                        raise ValueError
+                else:
+                    time_budget = float(args[1])
+                    if not time_budget > 0:
+                        raise ValueError
+            except ValueError:
+                raise EngineError('usage: go [depth N | time SECONDS]')
+        ai = self.player('XO'[b.moves % 2])
+        if lookahead is not None:
+            ai.lookahead = lookahead
+        self._cancel = threading.Event()
+        self._search = threading.Thread(target=self.search,
+                                        args=(ai, b.copy(), time_budget, self._cancel),
+                                        daemon=True)
+        self._search.start()
+
+    def search(self, ai, board, time_budget, cancel):
+        """ the search thread: finds and reports the move for board """
+        ai.cancel_event = cancel
+        try:
+            try:
+                col = ai.next_move(board, time_budget)
+            except SearchTimeout:
+                # stopped during a fixed-depth search or a solve: fall back
+                # on a depth 1 search, in this process
+                ai.cancel_event = None
+                col = ai.max_score_column(ai.serial_scores(board, 1))
+                ai.last_depth = ai.stats.depth = 1
+        except Exception as e:
+            self.send('error search failed: ' + repr(e))
+            return
+        finally:
+            ai.cancel_event = None
+        stats = ai.stats
+        self.last = dict(stats.as_dict(), depth=ai.last_depth, move=col)
+        self.send('info ' + stats.summary())
+        self.send('bestmove ' + str(col))
+
+    def stop(self):
+        """ stops any search and waits for its reply to be sent """
+        if self._search is not None:
+            self._cancel.set()
+            self._search.join()
+            self._search = None
+
+    def cmd_stop(self, args):
+        self.stop()
+
+    def cmd_isready(self, args):
+        self.send('readyok')
+
+    def cmd_stats(self, args):
+        if self.last is None:
+            raise EngineError('no search yet')
+        self.send('stats ' + json.dumps(self.last))
+
+    def run(self, lines):
+        """ carries out commands from the iterable lines until quit or the
+            end of the input, then waits for any search to finish """
+        for line in lines:
+            if not self.handle(line):
+                return
+        if self._search is not None:
+            self._search.join()
+
+
+def main(argv=None):
+    """ command line entry point: serves stdin and stdout """
+    parser = argparse.ArgumentParser(
+        description='Connect Four engine speaking a line protocol on stdin/stdout.',
+        epilog='commands: newgame, position, play, set, go, stop, isready, stats, quit')
+    parser.parse_args(argv)
+    Engine().run(sys.stdin)
+
+
+if __name__ == '__main__':
+    main()
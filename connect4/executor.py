@@ -0,0 +1,97 @@
+"""
+ A long-lived background thread that computes AI moves one at a time.
+
+ Each job searches its own copy of the board, so the caller's board can be
+ read (and drawn) while the AI thinks; the chosen column comes back through
+ a queue for the caller to play. cancel() abandons every job handed in so
+ far: queued jobs never start, and the one running stops at its next
+ cancellation check instead of searching on to the end.
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .ai_player import SearchTimeout
+
+
+class AIExecutor:
+    """ runs AI moves on a single worker thread kept for its whole life """
+
+    def __init__(self):
+        """ constructs an AIExecutor with an idle worker """
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        # cancellation tokens of the jobs not yet finished
+        self._tokens = set()
+        self._generation = 0
+
+    def __repr__(self):
+        """ returns a string representing an AIExecutor object """
+        return "AIExecutor(" + str(len(self._tokens)) + " pending)"
+
+    def submit(self, player, board, tag=None):
+        """ queues a search for player's move on a snapshot of board.
+            player is an AIPlayer, or a Ponderer for one. When it finishes,
+            (tag, column, stats, error) is posted for poll(): error is None
+            or the exception the search raised. """
+        snapshot = board.copy()
+        token = threading.Event()
+        with self._lock:
+            self._tokens.add(token)
+            generation = self._generation
+        self._pool.submit(self._run, player, snapshot, token, generation, tag)
+
+    def _run(self, player, board, token, generation, tag):
+        """ the worker thread: searches one job unless it was cancelled """
+        ai = getattr(player, 'ai', player)
+        try:
+            if token.is_set():
+                return
+            if ai is not player:
+                # a Ponderer: stop its thread before the search takes over
+                # the player's cancel_event
+                player.stop()
+            ai.cancel_event = token
+            try:
+                col = player.next_move(board)
+                result = (tag, col, ai.stats, None)
+            except SearchTimeout:
+                return
+            except Exception as e:
+                result = (tag, None, None, e)
+            finally:
+                ai.cancel_event = None
+            if not token.is_set():
+                self._results.put((generation, result))
+        finally:
+            with self._lock:
+                self._tokens.discard(token)
+
+    def poll(self):
+        """ returns the next finished job's (tag, column, stats, error),
+            or None if there is none; cancelled jobs are never returned """
+        while True:
+            try:
+                generation, result = self._results.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self._generation:
+                return result
+
+    def busy(self):
+        """ returns True while a job is queued or running """
+        return bool(self._tokens)
+
+    def cancel(self):
+        """ abandons every job submitted so far, running or not """
+        with self._lock:
+            self._generation += 1
+            for token in self._tokens:
+                token.set()
+
+    def shutdown(self, wait=True):
+        """ cancels all jobs and stops the worker thread """
+        self.cancel()
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,165 @@
+"""
+ A load generator for connect4.server.
+
+ Opens one connection per simulated client; each plays whole games against
+ the server's AI with random legal moves, timing every request, until the
+ requested number of games is done. Refused ('busy') moves are retried
+ after a short pause. Prints latency percentiles and throughput:
+
+     python -m connect4.loadgen --port 4444 --clients 200 --games 400 \\
+         --player ai:lookahead=4 --time-budget 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+def percentile(values, p):
+    """ returns the p-th percentile (0 to 100) of the list values, by
+        nearest rank """
+    assert(values)
+    ordered = sorted(values)
+    rank = max(1, round(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LoadResult:
+    """ what a load run measured: per-request latencies in seconds, counts
+        of games, AI moves and refused requests, and the wall time """
+
+    def __init__(self):
+        """ constructs an empty LoadResult """
+        self.latencies = []
+        self.games = 0
+        self.ai_moves = 0
+        self.busy = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        """ returns a string representing a LoadResult object """
+        return "LoadResult(" + self.summary() + ")"
+
+    def summary(self):
+        """ returns a one-line report """
+        s = str(self.games) + ' games, ' + str(len(self.latencies)) + ' requests in ' + \
+            str(round(self.seconds, 2)) + 's'
+        if self.seconds:
+            s += ', ' + str(round(len(self.latencies) / self.seconds, 1)) + ' req/s, ' + \
+                 str(round(self.ai_moves / self.seconds, 1)) + ' AI moves/s'
+        if self.latencies:
+            s += ', latency ms p50 ' + str(round(1000 * percentile(self.latencies, 50), 1)) + \
+                 ' p90 ' + str(round(1000 * percentile(self.latencies, 90), 1)) + \
+                 ' p99 ' + str(round(1000 * percentile(self.latencies, 99), 1)) + \
+                 ' max ' + str(round(1000 * max(self.latencies), 1))
+        return s + ', ' + str(self.busy) + ' busy, ' + str(self.errors) + ' errors'
+
+
+async def request(reader, writer, message, result):
+    """ sends one request and returns its reply, recording the latency """
+    start = time.perf_counter()
+    writer.write(json.dumps(message).encode('utf-8') + b'\n')
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError('server closed the connection')
+    result.latencies.append(time.perf_counter() - start)
+    reply = json.loads(line)
+    if not reply['ok']:
+        if reply['error'] == 'busy':
+            result.busy += 1
+        else:
+            result.errors += 1
+    return reply
+
+
+async def play_games(connect, games_left, new_game, rng, result):
+    """ one simulated client: plays games while games_left (a one-item
+        list shared by the clients) is above zero """
+    reader, writer = await connect()
+    try:
+        while games_left[0] > 0:
+            games_left[0] -= 1
+            reply = await request(reader, writer, new_game, result)
+            while not reply['ok'] and reply['error'] == 'busy':
+                await asyncio.sleep(0.01)
+                reply = await request(reader, writer, new_game, result)
+            if not reply['ok']:
+                continue
+            game = reply['game']
+            height = new_game.get('height', 6)
+            heights = [0] * new_game.get('width', 7)
+            if 'ai_move' in reply:
+                result.ai_moves += 1
+            for col in reply['moves']:
+                heights[col] += 1
+            while reply['ok'] and reply['result'] is None:
+                col = rng.choice([c for c in range(len(heights)) if heights[c] < height])
+                reply = await request(reader, writer, {'op': 'move', 'game': game, 'col': col},
+                                      result)
+                while not reply['ok'] and reply['error'] == 'busy':
+                    await asyncio.sleep(0.01)
+                    reply = await request(reader, writer,
+                                          {'op': 'move', 'game': game, 'col': col}, result)
+                if reply['ok']:
+                    heights[col] += 1
+                    if 'ai_move' in reply:
+                        result.ai_moves += 1
+                        heights[reply['ai_move']] += 1
+            await request(reader, writer, {'op': 'close', 'game': game}, result)
+            result.games += 1
+    finally:
+        writer.close()
+
+
+async def run_load(host='127.0.0.1', port=4444, path=None, clients=10, games=20,
+                   player='ai:lookahead=4', time_budget=None, height=6, width=7, k=4,
+                   seed=0):
+    """ plays games games over clients connections at once and returns a
+        LoadResult """
+    if path is not None:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(host, port)
+    new_game = {'op': 'new', 'player': player, 'height': height, 'width': width, 'k': k}
+    if time_budget is not None:
+        new_game['time_budget'] = time_budget
+    result = LoadResult()
+    games_left = [games]
+    start = time.perf_counter()
+    await asyncio.gather(*[play_games(connect, games_left, new_game,
+                                      random.Random(seed + i), result)
+                           for i in range(clients)])
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    """ command line entry point """
+    parser = argparse.ArgumentParser(description='Load-test a Connect Four server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4444)
+    parser.add_argument('--unix', metavar='PATH', help='connect to a Unix socket instead')
+    parser.add_argument('--clients', type=int, default=10, help='connections at once')
+    parser.add_argument('--games', type=int, default=20, help='games in all')
+    parser.add_argument('--player', default='ai:lookahead=4')
+    parser.add_argument('--time-budget', type=float, default=None)
+    parser.add_argument('--height', type=int, default=6)
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--k', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_load(args.host, args.port, args.unix, args.clients, args.games,
+                                  args.player, args.time_budget, args.height, args.width,
+                                  args.k, args.seed))
+    print(result.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+ Move ordering for the alpha-beta search
+"""
+
+
+class FixedOrdering:
+    """ tries the columns left to right, as the search always used to """
+
+    def new_search(self):
+        """ called once before each root search """
+        pass
+
+    def columns(self, board, depth, checker, tt_move=-1, ply=0):
+        """ returns the legal columns of board in the order to search them.
+            depth is the remaining search depth, checker the side to move,
+            tt_move the best column remembered for this position (or -1)
+            and ply how many moves below the root the position is
+        """
+        return [c for c in range(board.width) if board.can_add_to(c)]
+
+    def cutoff(self, col, depth, checker, ply=0):
+        """ told that playing col caused a beta cutoff at this depth and ply """
+        pass
+
+
+class CenterOrdering(FixedOrdering):
+    """ tries the columns nearest the middle first; those take part in
+        the most lines and are usually the strongest moves
+    """
+
+    def __init__(self):
+        self._center_orders = {}
+
+    def center_order(self, width):
+        """ returns the columns of a board width, middle first, with the
+            left one of each equally central pair ahead of the right one """
+        if width not in self._center_orders:
+            self._center_orders[width] = sorted(range(width),
+                                                key=lambda c: abs(2 * c - (width - 1)))
+        return self._center_orders[width]
+
+    def columns(self, board, depth, checker, tt_move=-1, ply=0):
+        return [c for c in self.center_order(board.width) if board.can_add_to(c)]
+
+
+class HeuristicOrdering(CenterOrdering):
+    """ tries the transposition table's best move first, then up to two
+        killer moves that caused cutoffs at the same ply, then the rest by
+        their history score, falling back to center-first
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.killers = {}
+        self.history = {'X': {}, 'O': {}}
+
+    def new_search(self):
+        """ forgets the killers and ages the history scores, so that what
+            was learned on the previous move still counts, but less """
+        self.killers = {}
+        for table in self.history.values():
+            for col in table:
+                table[col] //= 2
+
+    def columns(self, board, depth, checker, tt_move=-1, ply=0):
+        cols = super().columns(board, depth, checker)
+        history = self.history[checker]
+        # sorted() is stable, so equal history keeps the center-first order
+        cols.sort(key=lambda c: -history.get(c, 0))
+        # killers are kept per ply, not per remaining depth: when the search
+        # deepens, the same depth left falls at a different ply
+        first = [tt_move] + self.killers.get(ply, [])
+        for col in reversed(first):
+            if col in cols:
+                cols.remove(col)
+                cols.insert(0, col)
+        return cols
+
+    def cutoff(self, col, depth, checker, ply=0):
+        killers = self.killers.setdefault(ply, [])
+        if col not in killers:
+            killers.insert(0, col)
+            del killers[2:]
+        history = self.history[checker]
+        history[col] = history.get(col, 0) + depth * depth
+
+
+ORDERINGS = {
+    'FIXED': FixedOrdering,
+    'CENTER': CenterOrdering,
+    'HEURISTIC': HeuristicOrdering,
+}
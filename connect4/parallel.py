@@ -0,0 +1,121 @@
+"""
+ Process pools for searching the AI's root columns in parallel
+"""
+
+import atexit
+import pickle
+
+from .stats import SearchStats
+
+# one pool per worker count, shared by every AIPlayer in this process
+_pools = {}
+
+# a byte per search in flight, in memory shared with every worker: set to
+# stop that search's jobs. Searches take the slots in turn.
+STOP_SLOTS = 64
+_stop_flags = None
+_next_slot = 0
+
+# the AIPlayers with a persistent cache a worker process has built, by
+# pickled constructor args, so the file is mapped once per process
+_worker_players = {}
+
+
+def _init_worker(stop_flags):
+    """ runs once in each new worker: keeps the shared stop flags """
+    global _stop_flags
+    _stop_flags = stop_flags
+
+
+def get_pool(workers):
+    """ returns the shared ProcessPoolExecutor with the given number of
+        workers, starting it the first time it is asked for """
+    global _stop_flags
+    if workers not in _pools:
+        # imported here: they are slow to load, and only parallel searches need them
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        if _stop_flags is None:
+            _stop_flags = multiprocessing.RawArray('b', STOP_SLOTS)
+        # never fork: a pool may be started from a search thread while
+        # another thread holds a lock (the engine's, reading stdin), and a
+        # forked worker would wait for it forever
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() \
+            else 'spawn'
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=multiprocessing.get_context(method),
+                                              initializer=_init_worker,
+                                              initargs=(_stop_flags,))
+    return _pools[workers]
+
+
+class StopFlag:
+    """ one search's flag among the shared stop flags, with the is_set()
+        and set() of a threading.Event; it can be sent to a worker """
+
+    def __init__(self, slot):
+        """ constructs a StopFlag for the given slot """
+        self.slot = slot
+
+    def __repr__(self):
+        """ returns a string representing a StopFlag object """
+        return "StopFlag(" + str(self.slot) + ", " + str(self.is_set()) + ")"
+
+    def is_set(self):
+        return _stop_flags[self.slot] != 0
+
+    def set(self):
+        _stop_flags[self.slot] = 1
+
+
+def new_stop_flag():
+    """ returns a cleared StopFlag for a new search; get_pool must have
+        been called first """
+    global _next_slot
+    slot = _next_slot
+    _next_slot = (slot + 1) % STOP_SLOTS
+    _stop_flags[slot] = 0
+    return StopFlag(slot)
+
+
+def shutdown_pools():
+    """ stops every pool started by get_pool """
+    for pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+
+atexit.register(shutdown_pools)
+
+
+def search_column(config, board, col, lookahead, time_left=None, stop=None):
+    """ runs in a worker: returns the score of playing col on board for the
+        AIPlayer built from config (its pickled constructor keyword arguments),
+        or None if time_left seconds run out or the StopFlag stop is set
+        first, along with the search's SearchStats.as_dict()
+    """
+    from .ai_player import AIPlayer, SearchTimeout
+    # which worker gets which column is up to the pool, and a table or
+    # move ordering left over from an earlier job would change the scores,
+    # so every job starts afresh. A cache file is shared by design: results
+    # taken from it depend on what has been searched before, anywhere.
+    ai = _worker_players.get(config)
+    if ai is None:
+        args = pickle.loads(config)
+        ai = AIPlayer(**args)
+        if args.get('cache') is not None:
+            _worker_players[config] = ai
+    ai.ordering.new_search()
+    ai.stats = SearchStats()
+    tt_before = (ai.tt.hits, ai.tt.misses) if ai.tt is not None else None
+    ai.cancel_event = stop
+    try:
+        score = ai.column_score(board, col, lookahead, time_left)
+    except SearchTimeout:
+        score = None
+    finally:
+        ai.cancel_event = None
+    if tt_before is not None:
+        ai.stats.tt_hits = ai.tt.hits - tt_before[0]
+        ai.stats.tt_misses = ai.tt.misses - tt_before[1]
+    return score, ai.stats.as_dict()
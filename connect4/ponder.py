@@ -0,0 +1,137 @@
+"""
+ Pondering: searching on the opponent's time.
+
+ While the opponent thinks, a Ponderer searches the AI's answer to each
+ of the opponent's possible moves on a background thread, most likely
+ (central) moves first. When the real move arrives the other branches are
+ abandoned; a finished result for the move played is used as it is, and an
+ unfinished one still leaves its transposition table entries behind (the
+ positions searched and their values, kept by an ALPHABETA player with a
+ tt_size). A MINIMAX player, or one without a table, reuses only finished
+ results.
+"""
+
+import threading
+
+from .ai_player import SearchTimeout
+
+
+class Ponderer:
+    """ ponders for one AIPlayer. The player must not be used directly
+        while it is pondering: go through next_move, which stops the
+        background search first.
+    """
+
+    def __init__(self, ai):
+        """ constructs a Ponderer for the AIPlayer ai """
+        self.ai = ai
+        # reply column -> (scores, stats, last_depth) of finished searches
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        self._thread = None
+        self._stop = None
+        self._position = None
+        self._symmetric = False
+
+    def __repr__(self):
+        """ returns a string representing a Ponderer object """
+        return "Ponderer(" + repr(self.ai) + ", " + str(len(self.results)) + " replies ready)"
+
+    def start(self, board):
+        """ starts pondering board, on which it is the opponent's turn.
+            board itself is not touched: the search works on a copy. """
+        self.stop()
+        self.results = {}
+        board = board.copy()
+        opponent = self.ai.opponent_checker()
+        self._position = (board.bitboard(self.ai.checker), board.bitboard(opponent))
+        self._symmetric = board.is_symmetric()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._ponder, args=(board, self._stop),
+                                        daemon=True)
+        self._thread.start()
+
+    def _ponder(self, board, stop):
+        """ the background thread: searches the reply to each opponent move
+            in turn until all are done or stop is set """
+        ai = self.ai
+        opponent = ai.opponent_checker()
+        replies = sorted(range(board.width), key=lambda c: abs(2 * c - (board.width - 1)))
+        if self._symmetric:
+            # a reply and its mirror image lead to mirrored positions
+            replies = [c for c in replies if 2 * c <= board.width - 1]
+        ai.cancel_event = stop
+        try:
+            for col in replies:
+                if stop.is_set():
+                    return
+                if not board.can_add_to(col):
+                    continue
+                row = board.play(opponent, col)
+                try:
+                    if board.is_win_at(row, col) or board.is_full():
+                        continue
+                    if ai.book is not None and ai.book.lookup(board, ai.checker) is not None:
+                        continue
+                    scores = ai.scores_for(board)
+                    self.results[col] = (scores, ai.stats, ai.last_depth)
+                except SearchTimeout:
+                    return
+                finally:
+                    board.undo()
+        finally:
+            ai.cancel_event = None
+
+    def stop(self):
+        """ abandons pondering and waits for the background thread """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """ waits up to timeout seconds (forever if None) for every reply
+            to be searched; returns True if pondering has finished """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def reply_to(self, board):
+        """ returns the column the opponent played to turn the pondered
+            position into board, or None if board is not one move on """
+        if self._position is None:
+            return None
+        mine, theirs = self._position
+        opponent = self.ai.opponent_checker()
+        added = board.bitboard(opponent) ^ theirs
+        if board.bitboard(self.ai.checker) != mine or added & theirs or \
+           added == 0 or added & (added - 1):
+            return None
+        return (added.bit_length() - 1) // (board.height + 1)
+
+    def next_move(self, board, time_budget=None):
+        """ stops pondering and returns the AI's move for board, using the
+            pondered result when board is the pondered position plus the
+            opponent's move and that search had finished. Pondering
+            searches to the player's lookahead, so players given a
+            time_budget only gain the warmed-up transposition table. """
+        self.stop()
+        ai = self.ai
+        col = self.reply_to(board)
+        result = self.results.get(col) if col is not None else None
+        if result is None and col is not None and self._symmetric:
+            mirrored = self.results.get(board.width - 1 - col)
+            if mirrored is not None:
+                scores, stats, depth = mirrored
+                result = (scores[::-1], stats, depth)
+        self._position = None
+        self.results = {}
+        if result is None or time_budget is not None or ai.time_budget is not None:
+            self.misses += 1
+            return ai.next_move(board, time_budget)
+        self.hits += 1
+        ai.num_moves += 1
+        scores, ai.stats, ai.last_depth = result
+        return ai.max_score_column(scores)
@@ -0,0 +1,252 @@
+"""
+ Compact encodings of positions and streams of finished games.
+
+ A position is identified by Board.key(), which takes (height + 1) * width
+ bits: it fits in 64 bits for boards up to 6x9 or 7x8, and for those
+ position_key() and position_from_key() are all that is needed. For any
+ size, encode_position() gives a short byte string that includes the board
+ size and how many in a row win.
+
+ A game record is a dict with at least 'height', 'width', 'moves' (the
+ columns played, 'X' first), 'result' ('X', 'O', 'draw' or None if the game
+ was not finished) and optionally 'move_times' (seconds per move). Other
+ keys are kept as they are. Records are appended to a file one at a time,
+ either as JSON lines or in a binary format, and read back lazily:
+
+     with RecordWriter('games.c4g') as out:
+         out.write(record)
+     for record in read_records('games.c4g'):
+         ...
+"""
+
+import json
+import os
+
+from .board import Board
+
+MAGIC = b'C4GR'
+VERSION = 1
+RESULTS = [None, 'X', 'O', 'draw']
+STANDARD_KEYS = ('height', 'width', 'moves', 'result', 'move_times')
+
+
+def write_varint(out, n):
+    """ appends the unsigned int n to the bytearray out, 7 bits per byte
+        with the high bit set on every byte but the last """
+    assert(n >= 0)
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    """ returns (n, new pos) for the varint at data[pos] """
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def position_key(board):
+    """ returns board's key as an int below 2 ** 64; the board must have
+        (height + 1) * width <= 64 """
+    assert((board.height + 1) * board.width <= 64)
+    return board.key()
+
+
+def position_from_key(key, height, width, k=4):
+    """ returns the Board with the given key() """
+    b = Board(height, width, k)
+    stride = height + 1
+    for col in range(width):
+        # the column is its 'X' bits plus 2 ** n - 1 for n checkers,
+        # somewhere from 2 ** n - 1 up to 2 ** (n + 1) - 2
+        column = (key >> (col * stride)) & ((1 << stride) - 1)
+        n = (column + 1).bit_length() - 1
+        x_bits = column - ((1 << n) - 1)
+        for r in range(n):
+            b.add_checker('X' if x_bits >> r & 1 else 'O', col)
+    return b
+
+
+def encode_position(board):
+    """ returns a byte string holding board's size, k and key, for boards
+        of any size """
+    out = bytearray()
+    write_varint(out, board.height)
+    write_varint(out, board.width)
+    write_varint(out, board.k)
+    write_varint(out, board.key())
+    return bytes(out)
+
+
+def decode_position(data):
+    """ returns the Board encoded by encode_position """
+    height, pos = read_varint(data, 0)
+    width, pos = read_varint(data, pos)
+    k, pos = read_varint(data, pos)
+    key, pos = read_varint(data, pos)
+    return position_from_key(key, height, width, k)
+
+
+def replay(record):
+    """ returns the Board at the end of a game record; records of games
+        to other than 4 in a row have a 'k' key """
+    b = Board(record['height'], record['width'], record.get('k', 4))
+    b.add_checkers(record['moves'])
+    return b
+
+
+def encode_record(record):
+    """ returns the binary form of a game record (without its length) """
+    out = bytearray()
+    write_varint(out, record['height'])
+    write_varint(out, record['width'])
+    out.append(RESULTS.index(record.get('result')))
+    moves = record['moves']
+    write_varint(out, len(moves))
+    for col in moves:
+        write_varint(out, col)
+    times = record.get('move_times')
+    out.append(times is not None)
+    if times is not None:
+        # whole microseconds
+        for t in times:
+            write_varint(out, round(t * 1e6))
+    extra = {k: v for k, v in record.items() if k not in STANDARD_KEYS}
+    if extra:
+        text = json.dumps(extra).encode('utf-8')
+        write_varint(out, len(text))
+        out += text
+    else:
+        write_varint(out, 0)
+    return bytes(out)
+
+
+def decode_record(data):
+    """ returns the game record dict encoded by encode_record """
+    height, pos = read_varint(data, 0)
+    width, pos = read_varint(data, pos)
+    result = RESULTS[data[pos]]
+    n, pos = read_varint(data, pos + 1)
+    moves = []
+    for i in range(n):
+        col, pos = read_varint(data, pos)
+        moves.append(col)
+    record = {'height': height, 'width': width, 'moves': moves, 'result': result}
+    has_times = data[pos]
+    pos += 1
+    if has_times:
+        times = []
+        for i in range(n):
+            t, pos = read_varint(data, pos)
+            times.append(t / 1e6)
+        record['move_times'] = times
+    length, pos = read_varint(data, pos)
+    if length:
+        record.update(json.loads(bytes(data[pos:pos + length]).decode('utf-8')))
+    return record
+
+
+def record_format(path):
+    """ returns 'jsonl' for .jsonl/.json paths and 'binary' otherwise """
+    return 'jsonl' if os.path.splitext(path)[1] in ('.jsonl', '.json') else 'binary'
+
+
+class RecordWriter:
+    """ appends game records to a file, in JSON lines or binary format
+        (chosen from the file name unless given). Every record is written
+        straight through, so a reader sees all games finished so far.
+    """
+
+    def __init__(self, path, fmt=None):
+        """ opens path for appending, writing the binary header if the
+            file is new """
+        self.path = path
+        self.format = fmt or record_format(path)
+        assert(self.format in ('jsonl', 'binary'))
+        if self.format == 'jsonl':
+            self._file = open(path, 'a')
+        else:
+            self._file = open(path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(MAGIC + bytes([VERSION]))
+            else:
+                try:
+                    _check_header(path)
+                except ValueError:
+                    self._file.close()
+                    raise
+        self.count = 0
+
+    def __repr__(self):
+        """ returns a string describing the writer """
+        return "RecordWriter(" + self.path + ", " + self.format + ", " + \
+               str(self.count) + " written)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        """ appends one game record """
+        if self.format == 'jsonl':
+            self._file.write(json.dumps(record) + '\n')
+        else:
+            data = encode_record(record)
+            frame = bytearray()
+            write_varint(frame, len(data))
+            self._file.write(bytes(frame) + data)
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def _check_header(path):
+    """ raises ValueError unless path starts with the binary header """
+    with open(path, 'rb') as f:
+        header = f.read(len(MAGIC) + 1)
+    if header != MAGIC + bytes([VERSION]):
+        raise ValueError(path + ' is not a connect4 game record file')
+
+
+def read_records(path, fmt=None):
+    """ yields the game records in path one at a time, reading and
+        decoding each only when it is asked for """
+    fmt = fmt or record_format(path)
+    if fmt == 'jsonl':
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    _check_header(path)
+    with open(path, 'rb') as f:
+        f.seek(len(MAGIC) + 1)
+        while True:
+            # the frame length is a varint read a byte at a time
+            length = 0
+            shift = 0
+            byte = f.read(1)
+            while byte and byte[0] >= 0x80:
+                length |= (byte[0] & 0x7F) << shift
+                shift += 7
+                byte = f.read(1)
+            if not byte:
+                return
+            length |= byte[0] << shift
+            data = f.read(length)
+            if len(data) < length:
+                # a record cut short by a writer that is still going
+                return
+            yield decode_record(data)
@@ -0,0 +1,441 @@
+"""
+ An asyncio game server: many games at once, AI moves on a shared pool.
+
+ Clients speak newline-delimited JSON over TCP or a Unix socket. Every
+ request is an object with an 'op' and optionally an 'id', which is echoed
+ in the reply; replies have 'ok': true, or 'ok': false and an 'error'.
+
+     {"op": "new", "player": "ai:lookahead=5", "ai": "O",
+      "height": 6, "width": 7, "k": 4, "time_budget": 0.5}
+         -> {"ok": true, "game": 1, "moves": [...]}
+     {"op": "move", "game": 1, "col": 3, "time_budget": 0.2}
+         -> {"ok": true, "ai_move": 2, "moves": [...], "result": null}
+     {"op": "state", "game": 1}    {"op": "close", "game": 1}
+     {"op": "stats"}
+
+ 'player' is a tournament player spec ('random' or 'ai:...') for the AI
+ side, which plays 'ai' ('X' or 'O'); if it plays 'X' its first move comes
+ back from 'new'. Clients may only set algo ('MINIMAX' or 'ALPHABETA'),
+ evaluator, ordering, tiebreak and a lookahead up to the server's limit:
+ anything that could hold a worker indefinitely, use up its memory or
+ touch its files (SOLVE, tt_size, workers, book, cache) is refused.
+ After each 'move' the AI answers unless the game is over; 'result' is
+ then 'X', 'O' or 'draw'. time_budget (seconds, capped by the server's
+ limit) switches the AI to iterative deepening for that move. Without
+ one the AI searches to its lookahead, but only for as long as the
+ server's limit: past that it plays what a depth 1 search finds.
+
+ AI moves run on one bounded process pool shared by every game. At most
+ max_pending moves are admitted at a time; further requests wait for a
+ place, and while a connection waits the server stops reading from it, so
+ a client sending faster than the pool can search is slowed down by TCP
+ itself. A request that has waited busy_timeout seconds is refused with
+ 'error': 'busy' instead.
+
+ From the command line:
+     python -m connect4.server --port 4444 --workers 4
+     python -m connect4.server --unix /tmp/connect4.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .ai_player import SearchTimeout
+from .board import Board
+from .evaluation import EVALUATORS
+from .ordering import ORDERINGS
+from .records import position_from_key
+from .tournament import parse_spec, make_player
+
+MAX_LINE = 1 << 16
+
+# the player spec keys a client may set, and the values allowed for each
+# (lookahead is checked against the server's max_lookahead instead)
+CLIENT_OPTIONS = {
+    'algo': ('MINIMAX', 'ALPHABETA'),
+    'evaluator': tuple(EVALUATORS),
+    'ordering': tuple(ORDERINGS),
+    'tiebreak': ('LEFT', 'RIGHT', 'RANDOM'),
+    'lookahead': None,
+}
+
+# the players a worker process has built, by pickled (config, checker),
+# so their transposition tables survive from one move to the next
+_worker_players = {}
+
+
+class Deadline:
+    """ has the is_set() of a threading.Event, and is set once seconds
+        have passed: as an AIPlayer's cancel_event it bounds any search """
+
+    def __init__(self, seconds):
+        """ constructs a Deadline seconds from now """
+        self.end = time.perf_counter() + seconds
+
+    def __repr__(self):
+        """ returns a string representing a Deadline object """
+        return "Deadline(" + str(round(self.end - time.perf_counter(), 3)) + "s left)"
+
+    def is_set(self):
+        return time.perf_counter() > self.end
+
+
+def search_move(config, checker, key, height, width, k, time_budget, max_seconds=None):
+    """ runs in a worker: returns (column, stats dict or None) for the
+        player built from config (a pickled spec dict) playing checker on
+        the position with the given Board.key(). Without a time_budget a
+        search still stops after max_seconds, and the move then comes from
+        a depth 1 search. """
+    player = _worker_players.get((config, checker))
+    if player is None:
+        player = make_player(pickle.loads(config), checker)
+        _worker_players[(config, checker)] = player
+    board = position_from_key(key, height, width, k)
+    if not hasattr(player, 'stats'):
+        return player.next_move(board), None
+    if time_budget is None and max_seconds is not None:
+        player.cancel_event = Deadline(max_seconds)
+    try:
+        col = player.next_move(board, time_budget)
+    except SearchTimeout:
+        player.cancel_event = None
+        col = player.max_score_column(player.serial_scores(board, 1))
+        player.last_depth = player.stats.depth = 1
+    finally:
+        player.cancel_event = None
+    return col, player.stats.as_dict()
+
+
+class Game:
+    """ one game hosted by the server """
+
+    def __init__(self, game_id, config, ai_checker, height, width, k, time_budget):
+        """ constructs a Game with an empty board """
+        self.id = game_id
+        self.config = pickle.dumps(config)
+        self.ai_checker = ai_checker
+        self.board = Board(height, width, k)
+        self.moves = []
+        self.result = None
+        self.time_budget = time_budget
+        # one request at a time may change the game
+        self.lock = asyncio.Lock()
+
+    def __repr__(self):
+        """ returns a string representing a Game object """
+        return "Game(" + str(self.id) + ", " + str(len(self.moves)) + " moves)"
+
+    def to_move(self):
+        """ returns the checker whose turn it is """
+        return 'XO'[len(self.moves) % 2]
+
+    def play(self, col):
+        """ plays col for the side to move and records any result """
+        checker = self.to_move()
+        row = self.board.add_checker(checker, col)
+        self.moves.append(col)
+        if self.board.is_win_at(row, col):
+            self.result = checker
+        elif self.board.is_full():
+            self.result = 'draw'
+
+    def state(self):
+        """ returns the reply fields describing the game """
+        return {'game': self.id, 'moves': list(self.moves), 'result': self.result,
+                'to_move': None if self.result else self.to_move()}
+
+
+class RequestError(Exception):
+    """ a request that cannot be carried out; its text is sent back """
+
+
+class GameServer:
+    """ hosts games for any number of connections, searching AI moves on a
+        pool of workers processes with at most max_pending moves admitted
+        at once (twice the workers by default) """
+
+    def __init__(self, workers=None, max_pending=None, busy_timeout=None,
+                 max_time_budget=10.0, default_player='ai:lookahead=4', max_lookahead=8):
+        """ constructs a GameServer; the pool starts with the server.
+            default_player is used when a client names no player, and is
+            not limited to the options clients may set. """
+        self.workers = workers
+        self.max_lookahead = max_lookahead
+        self.max_pending = max_pending
+        self.busy_timeout = busy_timeout
+        self.max_time_budget = max_time_budget
+        self.default_player = default_player
+        self.games = {}
+        self._next_id = 1
+        self._pool = None
+        self._slots = None
+        self._server = None
+        self.pending = 0
+        self.counts = {'requests': 0, 'ai_moves': 0, 'busy': 0, 'errors': 0}
+        self.ai_seconds = 0.0
+
+    def __repr__(self):
+        """ returns a string representing a GameServer object """
+        return "GameServer(" + str(len(self.games)) + " games, " + \
+               str(self.pending) + " AI moves pending)"
+
+    async def start(self, host='127.0.0.1', port=0, path=None):
+        """ starts the pool and listens on host:port, or on the Unix socket
+            path if given; returns the asyncio server """
+        if self.workers is None:
+            self.workers = os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        if self.max_pending is None:
+            self.max_pending = 2 * self.workers
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self.handle, path, limit=MAX_LINE)
+        else:
+            self._server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        return self._server
+
+    def address(self):
+        """ returns the (host, port) or path the server listens on """
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        """ stops listening and shuts the pool down """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def handle(self, reader, writer):
+        """ serves one connection, a request at a time: the next line is
+            not read until the last one has been answered """
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # a line over MAX_LINE, or the client went away
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = await self.respond(line)
+                writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line):
+        """ returns the reply dict for one request line """
+        self.counts['requests'] += 1
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                raise RequestError('bad JSON')
+            if not isinstance(request, dict):
+                raise RequestError('request must be an object')
+            request_id = request.get('id')
+            handler = getattr(self, 'op_' + str(request.get('op')), None)
+            if handler is None:
+                raise RequestError('unknown op ' + repr(request.get('op')))
+            reply = await handler(request)
+            reply['ok'] = True
+        except RequestError as e:
+            if str(e) == 'busy':
+                self.counts['busy'] += 1
+            else:
+                self.counts['errors'] += 1
+            reply = {'ok': False, 'error': str(e)}
+        if request_id is not None:
+            reply['id'] = request_id
+        return reply
+
+    def game(self, request):
+        """ returns the game a request names """
+        game = self.games.get(request.get('game'))
+        if game is None:
+            raise RequestError('no game ' + repr(request.get('game')))
+        return game
+
+    def client_player(self, spec):
+        """ returns the config dict of a player spec sent by a client,
+            refusing the options clients may not set """
+        if not isinstance(spec, str):
+            raise RequestError('player must be a spec string')
+        try:
+            config = parse_spec(spec)
+        except AssertionError:
+            raise RequestError('bad player spec')
+        for name, value in config.items():
+            if name == 'type':
+                continue
+            if name not in CLIENT_OPTIONS:
+                raise RequestError(name + ' cannot be set by clients')
+            if name == 'lookahead':
+                if not isinstance(value, int) or not 0 <= value <= self.max_lookahead:
+                    raise RequestError('lookahead must be an int from 0 to ' +
+                                       str(self.max_lookahead))
+            elif value not in CLIENT_OPTIONS[name]:
+                raise RequestError(name + ' must be one of ' + ', '.join(CLIENT_OPTIONS[name]))
+        return config
+
+    def time_budget(self, value):
+        """ returns a requested time budget, checked and capped """
+        if value is None:
+            return None
+        if not isinstance(value, (int, float)) or value <= 0:
+            raise RequestError('time_budget must be a positive number')
+        return min(value, self.max_time_budget)
+
+    async def ai_move(self, game, time_budget):
+        """ has the AI play its move in game, waiting for a place on the pool """
+        if self._slots.locked() and self.busy_timeout is not None:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.busy_timeout)
+            except asyncio.TimeoutError:
+                raise RequestError('busy')
+        else:
+            await self._slots.acquire()
+        self.pending += 1
+        start = time.perf_counter()
+        b = game.board
+        try:
+            col, stats = await asyncio.get_running_loop().run_in_executor(
+                self._pool, search_move, game.config, game.ai_checker, b.key(),
+                b.height, b.width, b.k, time_budget, self.max_time_budget)
+        except Exception as e:
+            raise RequestError('AI failed: ' + repr(e))
+        finally:
+            self.pending -= 1
+            self._slots.release()
+        self.ai_seconds += time.perf_counter() - start
+        self.counts['ai_moves'] += 1
+        game.play(col)
+        return col, stats
+
+    async def op_new(self, request):
+        """ starts a game; the AI moves first if it plays 'X' """
+        height = request.get('height', 6)
+        width = request.get('width', 7)
+        k = request.get('k', 4)
+        for value in (height, width, k):
+            if not isinstance(value, int) or not 1 <= value <= 32:
+                raise RequestError('height, width and k must be ints from 1 to 32')
+        ai_checker = request.get('ai', 'O')
+        if ai_checker not in ('X', 'O'):
+            raise RequestError("ai must be 'X' or 'O'")
+        if 'player' in request:
+            config = self.client_player(request['player'])
+        else:
+            config = parse_spec(self.default_player)
+        try:
+            # built here once so a bad spec fails now, not at the first AI move
+            make_player(config, ai_checker)
+        except (AssertionError, TypeError, ValueError) as e:
+            raise RequestError('bad player spec: ' + (str(e) or 'bad option'))
+        time_budget = self.time_budget(request.get('time_budget'))
+        game = Game(self._next_id, config, ai_checker, height, width, k, time_budget)
+        self._next_id += 1
+        self.games[game.id] = game
+        reply = {}
+        if ai_checker == 'X':
+            async with game.lock:
+                try:
+                    reply['ai_move'], reply['stats'] = await self.ai_move(game, time_budget)
+                except Exception:
+                    del self.games[game.id]
+                    raise
+        reply.update(game.state())
+        return reply
+
+    async def op_move(self, request):
+        """ plays the client's move, then the AI's answer """
+        game = self.game(request)
+        time_budget = self.time_budget(request.get('time_budget', game.time_budget))
+        async with game.lock:
+            if game.result is not None:
+                raise RequestError('game is over')
+            if game.to_move() == game.ai_checker:
+                raise RequestError("it is the AI's turn")
+            col = request.get('col')
+            if not isinstance(col, int) or not game.board.can_add_to(col):
+                raise RequestError('illegal move ' + repr(col))
+            game.play(col)
+            reply = {}
+            if game.result is None:
+                try:
+                    reply['ai_move'], reply['stats'] = await self.ai_move(game, time_budget)
+                except RequestError:
+                    # refused: take the client's move back so it can retry
+                    game.board.remove_checker(game.moves.pop())
+                    raise
+        reply.update(game.state())
+        return reply
+
+    async def op_state(self, request):
+        """ describes a game """
+        return self.game(request).state()
+
+    async def op_close(self, request):
+        """ forgets a game """
+        game = self.game(request)
+        del self.games[game.id]
+        return {'game': game.id}
+
+    async def op_stats(self, request):
+        """ describes the server's load """
+        return {'games': len(self.games), 'pending': self.pending,
+                'max_pending': self.max_pending, 'ai_seconds': round(self.ai_seconds, 6),
+                **self.counts}
+
+
+async def serve(server, host, port, path):
+    """ runs server until cancelled """
+    await server.start(host, port, path)
+    print('listening on', server.address())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    """ command line entry point """
+    parser = argparse.ArgumentParser(description='Serve Connect Four games over JSON lines.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4444)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead')
+    parser.add_argument('--workers', type=int, default=None, help='AI search processes')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='AI moves admitted at once (default twice the workers)')
+    parser.add_argument('--busy-timeout', type=float, default=None,
+                        help="seconds a request may wait for the pool before 'busy'")
+    parser.add_argument('--max-time-budget', type=float, default=10.0,
+                        help='longest any AI move may search, in seconds')
+    parser.add_argument('--player', default='ai:lookahead=4', help='default AI player spec')
+    parser.add_argument('--max-lookahead', type=int, default=8,
+                        help='deepest lookahead a client may ask for')
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.workers, args.max_pending, args.busy_timeout,
+                        args.max_time_budget, args.player, args.max_lookahead)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
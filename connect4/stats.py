@@ -0,0 +1,94 @@
+"""
+ Counters describing what one AI search did
+"""
+
+
+class SearchStats:
+    """ statistics for one AIPlayer move: nodes and seconds per root
+        column, cutoffs, terminal (won) positions reached, the deepest ply
+        searched, transposition table and opening book use, and whether
+        the move was forced
+    """
+
+    def __init__(self):
+        """ constructs an empty set of counters """
+        self.column_nodes = {}
+        self.column_seconds = {}
+        # work done for the position as a whole rather than one column
+        self.root_nodes = 0
+        self.cutoffs = 0
+        self.terminal_nodes = 0
+        self.max_ply = 0
+        self.depth = 0
+        self.seconds = 0.0
+        self.tt_hits = 0
+        self.tt_misses = 0
+        self.book_hit = False
+        # the move was an immediate win or the only block, found without search
+        self.forced = False
+
+    def __repr__(self):
+        """ returns a string representing a SearchStats object """
+        return "SearchStats(" + self.summary() + ")"
+
+    @property
+    def nodes(self):
+        """ the number of positions searched for the move """
+        return sum(self.column_nodes.values()) + self.root_nodes
+
+    def nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def tt_hit_rate(self):
+        """ returns the fraction of table probes that found the position,
+            or None if the table was not used """
+        probes = self.tt_hits + self.tt_misses
+        return self.tt_hits / probes if probes else None
+
+    def add_column(self, col, nodes, seconds):
+        """ adds the work done searching one root column """
+        self.column_nodes[col] = self.column_nodes.get(col, 0) + nodes
+        self.column_seconds[col] = self.column_seconds.get(col, 0.0) + seconds
+
+    def merge(self, d):
+        """ adds in the counters of as_dict() output from another process """
+        for col, nodes in d['column_nodes'].items():
+            self.add_column(int(col), nodes, d['column_seconds'][col])
+        self.root_nodes += d['root_nodes']
+        self.cutoffs += d['cutoffs']
+        self.terminal_nodes += d['terminal_nodes']
+        self.max_ply = max(self.max_ply, d['max_ply'])
+        self.tt_hits += d['tt_hits']
+        self.tt_misses += d['tt_misses']
+
+    def as_dict(self):
+        """ returns the counters as a dict of plain values """
+        return {
+            'column_nodes': dict(self.column_nodes),
+            'column_seconds': dict(self.column_seconds),
+            'root_nodes': self.root_nodes,
+            'nodes': self.nodes,
+            'cutoffs': self.cutoffs,
+            'terminal_nodes': self.terminal_nodes,
+            'max_ply': self.max_ply,
+            'depth': self.depth,
+            'seconds': self.seconds,
+            'tt_hits': self.tt_hits,
+            'tt_misses': self.tt_misses,
+            'book_hit': self.book_hit,
+            'forced': self.forced,
+        }
+
+    def summary(self):
+        """ returns a one-line description, short enough for a status bar """
+        if self.book_hit:
+            return 'book move'
+        if self.forced:
+            return 'forced move'
+        s = 'depth ' + str(self.depth) + ', ' + str(self.nodes) + ' nodes, ' + \
+            str(round(self.seconds, 2)) + 's, ' + \
+            str(int(self.nodes_per_second())) + ' nodes/s'
+        rate = self.tt_hit_rate()
+        if rate is not None:
+            s += ', TT ' + str(round(100 * rate)) + '%'
+        return s
@@ -0,0 +1,204 @@
+"""
+ Headless AI-vs-AI tournaments, run over a process pool.
+
+ Players are described by specs: 'random', or 'ai' optionally followed by
+ ':' and comma-separated AIPlayer keyword arguments, e.g.
+     ai:lookahead=4,algo=ALPHABETA,evaluator=WINDOWS
+
+ From the command line:
+     python -m connect4.tournament --player deep=ai:lookahead=6 \\
+         --player rand=random --games 20 --out results.jsonl
+"""
+
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .board import Board
+from .connect_four import RandomPlayer
+from .ai_player import AIPlayer
+from .records import RecordWriter
+
+
+def parse_spec(spec):
+    """ turns a player spec string into a dict with a 'type' key and the
+        keyword arguments for the player's constructor """
+    kind, _, args = spec.partition(':')
+    assert(kind == 'ai' or kind == 'random')
+    config = {'type': kind}
+    for item in args.split(','):
+        if not item:
+            continue
+        name, _, value = item.partition('=')
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        config[name] = value
+    return config
+
+
+def make_player(config, checker):
+    """ builds the player described by a spec dict for checker """
+    kwargs = {k: v for k, v in config.items() if k != 'type'}
+    if config['type'] == 'random':
+        return RandomPlayer(checker)
+    kwargs.setdefault('tiebreak', 'RANDOM')
+    kwargs.setdefault('lookahead', 4)
+    return AIPlayer(checker, **kwargs)
+
+
+def play_game(x_player, o_player, height=6, width=7, k=4):
+    """ plays one silent game and returns (moves, result, times): the
+        columns played, 'X', 'O' or 'draw', and the seconds each move took
+    """
+    b = Board(height, width, k)
+    players = {'X': x_player, 'O': o_player}
+    checker = 'X'
+    moves = []
+    times = []
+    while True:
+        start = time.perf_counter()
+        col = players[checker].next_move(b)
+        times.append(time.perf_counter() - start)
+        moves.append(col)
+        row = b.add_checker(checker, col)
+        if b.is_win_at(row, col):
+            return moves, checker, times
+        if b.is_full():
+            return moves, 'draw', times
+        checker = 'O' if checker == 'X' else 'X'
+
+
+def run_game(job):
+    """ plays the game described by a job dict (run in a worker process)
+        and returns its result record """
+    random.seed(job['seed'])
+    start = time.perf_counter()
+    moves, result, times = play_game(make_player(job['x_config'], 'X'),
+                                      make_player(job['o_config'], 'O'),
+                                      job['height'], job['width'], job['k'])
+    winner = None
+    if result == 'X':
+        winner = job['x']
+    elif result == 'O':
+        winner = job['o']
+    return {
+        'game': job['game'],
+        'x': job['x'],
+        'o': job['o'],
+        'seed': job['seed'],
+        'height': job['height'],
+        'width': job['width'],
+        'k': job['k'],
+        'result': result,
+        'winner': winner,
+        'moves': moves,
+        'move_times': [round(t, 6) for t in times],
+        'seconds': round(time.perf_counter() - start, 6),
+    }
+
+
+def pairings(names, mode):
+    """ returns the (first, second) name pairs that play each other:
+        every pair for 'round-robin', or the first name against each of
+        the others for 'gauntlet' """
+    if mode == 'gauntlet':
+        return [(names[0], other) for other in names[1:]]
+    assert(mode == 'round-robin')
+    return [(names[i], names[j]) for i in range(len(names))
+            for j in range(i + 1, len(names))]
+
+
+def schedule(players, games, mode='round-robin', seed=0, height=6, width=7, k=4):
+    """ returns the list of game jobs for a tournament between players, a
+        dict of name -> spec (string or dict). Each pairing plays games
+        games, swapping who has 'X' every game; game i uses seed + i.
+    """
+    configs = {name: parse_spec(spec) if isinstance(spec, str) else spec
+               for name, spec in players.items()}
+    jobs = []
+    for first, second in pairings(list(players), mode):
+        for g in range(games):
+            x, o = (first, second) if g % 2 == 0 else (second, first)
+            jobs.append({'game': len(jobs), 'x': x, 'o': o,
+                         'x_config': configs[x], 'o_config': configs[o],
+                         'seed': seed + len(jobs),
+                         'height': height, 'width': width, 'k': k})
+    return jobs
+
+
+def run_tournament(players, games, mode='round-robin', seed=0, workers=None,
+                   out=None, height=6, width=7, k=4):
+    """ plays a tournament (see schedule) on a pool of workers processes
+        and returns the per-game records in the order the games finished.
+        If out is a path, each record is appended to it as soon as its game
+        ends, as a JSON line for .jsonl files and in the binary game record
+        format otherwise (see connect4.records).
+    """
+    jobs = schedule(players, games, mode, seed, height, width, k)
+    records = []
+    writer = RecordWriter(out) if out is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_game, job) for job in jobs]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                if writer is not None:
+                    writer.write(record)
+    finally:
+        if writer is not None:
+            writer.close()
+    return records
+
+
+def standings(records):
+    """ returns {name: {'wins': w, 'losses': l, 'draws': d}} """
+    table = {}
+    for r in records:
+        for name in (r['x'], r['o']):
+            table.setdefault(name, {'wins': 0, 'losses': 0, 'draws': 0})
+        if r['winner'] is None:
+            table[r['x']]['draws'] += 1
+            table[r['o']]['draws'] += 1
+        else:
+            loser = r['o'] if r['winner'] == r['x'] else r['x']
+            table[r['winner']]['wins'] += 1
+            table[loser]['losses'] += 1
+    return table
+
+
+def main(argv=None):
+    """ command line entry point """
+    parser = argparse.ArgumentParser(description='Run a Connect Four tournament.')
+    parser.add_argument('--player', action='append', required=True,
+                        metavar='NAME=SPEC', help="e.g. deep=ai:lookahead=6 or rand=random")
+    parser.add_argument('--games', type=int, default=2, help='games per pairing')
+    parser.add_argument('--mode', choices=['round-robin', 'gauntlet'], default='round-robin')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--height', type=int, default=6)
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--k', type=int, default=4, help='checkers in a row needed to win')
+    parser.add_argument('--out', help='file to append game records to (.jsonl for JSON lines)')
+    args = parser.parse_args(argv)
+
+    players = {}
+    for item in args.player:
+        name, _, spec = item.partition('=')
+        players[name] = spec
+    start = time.perf_counter()
+    records = run_tournament(players, args.games, args.mode, args.seed,
+                             args.workers, args.out, args.height, args.width, args.k)
+    elapsed = time.perf_counter() - start
+    print(len(records), 'games in', round(elapsed, 2), 'seconds')
+    for name, row in sorted(standings(records).items(), key=lambda kv: -kv[1]['wins']):
+        print(name, row['wins'], 'W', row['losses'], 'L', row['draws'], 'D')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+ A fixed-size transposition table for the AI search
+"""
+
+from array import array
+
+# bound flags stored with each entry
+EMPTY = 0
+EXACT = 1
+LOWER = 2   # the true value is >= the stored value
+UPPER = 3   # the true value is <= the stored value
+
+# mixed into a board's Zobrist hash when 'O' is the side to move
+O_TO_MOVE = 0x9E3779B97F4A7C15
+
+
+class TranspositionTable:
+    """ a fixed-size hash table of search results keyed by a 64-bit
+        Zobrist hash. Entries live in preallocated arrays, so the memory
+        used never grows past what the constructor sets aside.
+    """
+
+    def __init__(self, size=1 << 18, policy='DEPTH'):
+        """ constructs a table with room for size entries (rounded up to
+            a power of two). policy is 'DEPTH' to keep the deeper of two
+            results that land in the same slot, or 'ALWAYS' to let the
+            newest result win.
+        """
+        assert(size > 0)
+        assert(policy == 'DEPTH' or policy == 'ALWAYS')
+        n = 1
+        while n < size:
+            n *= 2
+        self.size = n
+        self.policy = policy
+        self._mask = n - 1
+        self._keys = array('Q', bytes(8 * n))
+        self._depths = array('b', bytes(n))
+        self._values = array('d', bytes(8 * n))
+        self._flags = array('B', bytes(n))
+        self._moves = array('b', bytes(n))
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def __repr__(self):
+        """ returns a string summarizing the table and its counters """
+        return "TranspositionTable(" + str(self.size) + ", " + self.policy + \
+               ", hits=" + str(self.hits) + ", misses=" + str(self.misses) + \
+               ", collisions=" + str(self.collisions) + ")"
+
+    def __len__(self):
+        """ returns the number of occupied slots """
+        return self.size - self._flags.count(EMPTY)
+
+    def probe(self, key):
+        """ returns (depth, value, flag, move) stored for key, or None.
+            A slot holding a different position counts as a collision.
+        """
+        i = key & self._mask
+        flag = self._flags[i]
+        if flag != EMPTY and self._keys[i] == key:
+            self.hits += 1
+            return (self._depths[i], self._values[i], flag, self._moves[i])
+        if flag != EMPTY:
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag, move=-1):
+        """ records a search result for key, subject to the replacement
+            policy; move is the best column found, or -1 if none
+        """
+        i = key & self._mask
+        if self.policy == 'DEPTH' and self._flags[i] != EMPTY and \
+           self._keys[i] != key and self._depths[i] > depth:
+            return
+        self._keys[i] = key
+        self._depths[i] = min(depth, 127)
+        self._values[i] = value
+        self._flags[i] = flag
+        self._moves[i] = move
+        self.stores += 1
+
+    def clear(self):
+        """ empties the table and resets the counters """
+        self.__init__(self.size, self.policy)
+
+    def stats(self):
+        """ returns a dict of the table's counters """
+        probes = self.hits + self.misses
+        return {
+            'size': self.size,
+            'used': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'stores': self.stores,
+            'hit_rate': self.hits / probes if probes else 0.0,
+        }
@@ -1,19 +1,34 @@
 """Simple Pygame GUI for Connect Four (human X vs AI O).
 
-Usage: python3 gui_pygame.py
+Usage: python3 playgame.py [--height 6] [--width 7] [--k 4]
+
+Press S during a game to show the AI's search statistics. Against a
+human, the AI ponders its replies while the human is thinking. When the
+human moves, a reply already searched in full is played at once. With
+ALPHABETA an unfinished search still helps: the positions it reached
+are kept in a transposition table (a store of positions already searched
+and their values), so the real search finds them there. MINIMAX keeps no
+such table, so with it only finished replies are reused.
 
 Requires: pygame (pip install pygame)
 """
+import argparse
 import sys
-import threading
 import pygame
 from connect4.board import Board
 from connect4.ai_player import AIPlayer
+from connect4.ponder import Ponderer
+from connect4.executor import AIExecutor
 
 
 CELL_SIZE = 100
 RADIUS = CELL_SIZE // 2 - 6
 FPS = 30
+# transposition table entries for the AI that ponders against a human
+PONDER_TT_SIZE = 1 << 18
+# events telling us the window contents were lost and must be redrawn
+EXPOSE_EVENTS = {getattr(pygame, name) for name in ('VIDEOEXPOSE', 'WINDOWEXPOSED')
+                 if hasattr(pygame, name)}
 
 COLORS = {
     'bg': (28, 170, 156),
@@ -24,34 +39,122 @@ COLORS = {
 }
 
 
-def draw_board(screen, board):
-    h = board.height
-    w = board.width
-    # draw background
-    screen.fill(COLORS['bg'])
-    # draw grid
-    for r in range(h):
-        for c in range(w):
-            x = c * CELL_SIZE + CELL_SIZE // 2
-            y = r * CELL_SIZE + CELL_SIZE // 2
-            pygame.draw.rect(screen, COLORS['board'], (c * CELL_SIZE, r * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-            slot = board.slots[r][c]
-            if slot == 'X':
-                pygame.draw.circle(screen, COLORS['X'], (x, y), RADIUS)
-            elif slot == 'O':
-                pygame.draw.circle(screen, COLORS['O'], (x, y), RADIUS)
-            else:
-                pygame.draw.circle(screen, (230, 230, 230), (x, y), RADIUS)
-
-
-def main():
+EMPTY_COLOR = (230, 230, 230)
+
+# pre-rendered images, built on first use (pygame must be initialised)
+_cell_surfaces = {}
+_text_surfaces = {}
+_overlay_surfaces = {}
+
+
+def cell_surface(slot):
+    """ returns the cached CELL_SIZE x CELL_SIZE image of one slot """
+    surf = _cell_surfaces.get(slot)
+    if surf is None:
+        surf = pygame.Surface((CELL_SIZE, CELL_SIZE))
+        surf.fill(COLORS['board'])
+        pygame.draw.circle(surf, COLORS.get(slot, EMPTY_COLOR),
+                           (CELL_SIZE // 2, CELL_SIZE // 2), RADIUS)
+        _cell_surfaces[slot] = surf
+    return surf
+
+
+def text_surface(font, text, color=COLORS['text']):
+    """ returns font's rendering of text, cached since the same few
+        status lines are drawn over and over """
+    key = (id(font), text, color)
+    surf = _text_surfaces.get(key)
+    if surf is None:
+        if len(_text_surfaces) > 256:
+            _text_surfaces.clear()
+        surf = _text_surfaces[key] = font.render(text, True, color)
+    return surf
+
+
+def overlay_surface(size):
+    """ returns the cached translucent layer that dims the finished game """
+    surf = _overlay_surfaces.get(size)
+    if surf is None:
+        surf = pygame.Surface(size, pygame.SRCALPHA)
+        surf.fill((0, 0, 0, 120))
+        _overlay_surfaces[size] = surf
+    return surf
+
+
+def draw_board(screen, board, shown=None):
+    """ draws board's slots and returns the list of rects drawn. shown, if
+        given, is a grid of the slots currently on screen (None where
+        unknown): only slots that differ from it are drawn, and it is
+        brought up to date """
+    slots = board.slots
+    rects = []
+    for r in range(board.height):
+        for c in range(board.width):
+            slot = slots[r][c]
+            if shown is not None:
+                if shown[r][c] == slot:
+                    continue
+                shown[r][c] = slot
+            rects.append(screen.blit(cell_surface(slot), (c * CELL_SIZE, r * CELL_SIZE)))
+    return rects
+
+
+def forget_cells(shown, rect):
+    """ marks the slots under rect as needing to be drawn again """
+    for r in range(max(0, rect.top // CELL_SIZE),
+                   min(len(shown), (rect.bottom - 1) // CELL_SIZE + 1)):
+        for c in range(max(0, rect.left // CELL_SIZE),
+                       min(len(shown[r]), (rect.right - 1) // CELL_SIZE + 1)):
+            shown[r][c] = None
+
+
+def draw_game_over(screen, message, font, small_font):
+    """ dims the board and draws the end-of-game panel; returns the rects
+        of its Play Again and Quit buttons """
+    screen.blit(overlay_surface(screen.get_size()), (0, 0))
+
+    # panel
+    pw, ph = 420, 180
+    px = screen.get_width() // 2 - pw // 2
+    py = screen.get_height() // 2 - ph // 2
+    panel_rect = pygame.Rect(px, py, pw, ph)
+    pygame.draw.rect(screen, (245, 245, 245), panel_rect, border_radius=12)
+
+    big = text_surface(font, message, (20, 20, 20))
+    screen.blit(big, (px + (pw - big.get_width()) // 2, py + 24))
+
+    play_rect = pygame.Rect(px + 44, py + ph - 64, 140, 44)
+    pygame.draw.rect(screen, (60, 140, 70), play_rect, border_radius=8)
+    ptxt = text_surface(small_font, 'Play Again')
+    screen.blit(ptxt, (play_rect.x + (play_rect.width - ptxt.get_width()) // 2,
+                       play_rect.y + (play_rect.height - ptxt.get_height()) // 2))
+
+    quit_rect = pygame.Rect(px + pw - 44 - 140, py + ph - 64, 140, 44)
+    pygame.draw.rect(screen, (180, 60, 60), quit_rect, border_radius=8)
+    qtxt = text_surface(small_font, 'Quit')
+    screen.blit(qtxt, (quit_rect.x + (quit_rect.width - qtxt.get_width()) // 2,
+                       quit_rect.y + (quit_rect.height - qtxt.get_height()) // 2))
+    return play_rect, quit_rect
+
+
+def main(height=6, width=7, k=4):
+    """ runs the GUI on a height x width board where k in a row wins """
     pygame.init()
-    WIDTH = 7
-    HEIGHT = 6
+    WIDTH = width
+    HEIGHT = height
     size = (WIDTH * CELL_SIZE, HEIGHT * CELL_SIZE)
     screen = pygame.display.set_mode(size)
     pygame.display.set_caption('Connect Four - Human (X) vs AI (O)')
     clock = pygame.time.Clock()
+    # every AI move is searched on this one thread, on a copy of the board
+    executor = AIExecutor()
+
+    def quit_gui():
+        """ abandons any AI search and closes the window """
+        executor.shutdown()
+        pygame.quit()
+        sys.exit()
+
     font = pygame.font.SysFont(None, 36)
     small_font = pygame.font.SysFont(None, 20)
     # start menu state
@@ -150,13 +253,19 @@ def main():
         pygame.display.flip()
 
     while True:
+        menu_dirty = True
         while menu_running:
-            draw_menu()
+            # the menu only changes when clicked, so only then is it redrawn
+            if menu_dirty:
+                draw_menu()
+                menu_dirty = False
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    quit_gui()
+                if event.type in EXPOSE_EVENTS:
+                    menu_dirty = True
                 if event.type == pygame.MOUSEBUTTONDOWN:
+                    menu_dirty = True
                     mx, my = pygame.mouse.get_pos()
                     for i, r in enumerate(menu_btn_rects):
                         if r.collidepoint(mx, my):
@@ -173,13 +282,20 @@ def main():
 
                     if menu_start_rect and menu_start_rect.collidepoint(mx, my):
                         menu_running = False
+            clock.tick(FPS)
 
-        b = Board(HEIGHT, WIDTH)
+        b = Board(HEIGHT, WIDTH, k)
         ai_X = None
         ai_O = None
+        # only set when the AI plays a human, whose thinking time it can use
+        ponderer = None
         if mode == 0:
             # Human X, AI O
-            ai_O = AIPlayer('O', 'RANDOM', lookahead, algos[algo_idx])
+            # only ALPHABETA uses a table
+            tt_size = PONDER_TT_SIZE if algos[algo_idx] == 'ALPHABETA' else 0
+            ai_O = AIPlayer('O', 'RANDOM', lookahead, algos[algo_idx], tt_size=tt_size)
+            ponderer = Ponderer(ai_O)
+            ponderer.start(b)
         elif mode == 1:
             # Human X, Human O
             pass
@@ -192,46 +308,58 @@ def main():
         running = True
         message = ''
         ai_thinking = False
-
-        # helper to run AI move in background and update shared state
-        def start_ai_move(ai_player, checker, next_player):
-            def worker():
-                nonlocal ai_thinking, current, message
-                try:
-                    ai_thinking = True
-                    col = ai_player.next_move(b)
-                    if 0 <= col < b.width and b.can_add_to(col):
-                        b.add_checker(checker, col)
-                        if b.is_win_for(checker):
-                            message = f'{checker} wins!'
-                        elif b.is_full():
-                            message = "It's a tie!"
-                except Exception as e:
-                    message = 'AI error: ' + str(e)
-                finally:
-                    ai_thinking = False
-                    current = next_player
-
-            threading.Thread(target=worker, daemon=True).start()
+        ai_stats = ''
+        show_stats = False
+
+        def finish_ai_move(checker, col, stats, error):
+            """ plays the move a finished AI search chose """
+            nonlocal ai_thinking, current, message, ai_stats
+            ai_thinking = False
+            if error is not None:
+                message = 'AI error: ' + str(error)
+                return
+            ai_stats = f'{checker}: ' + stats.summary()
+            if 0 <= col < b.width and b.can_add_to(col):
+                row = b.add_checker(checker, col)
+                if b.is_win_at(row, col):
+                    message = f'{checker} wins!'
+                elif b.is_full():
+                    message = "It's a tie!"
+                elif ponderer is not None:
+                    ponderer.start(b)
+            current = 'O' if checker == 'X' else 'X'
 
         overlay_play_rect = None
         overlay_quit_rect = None
+        # what is on screen: the slots, the status/stats lines and the
+        # rects they cover, and whether the game over panel is up
+        shown = [[None] * WIDTH for _ in range(HEIGHT)]
+        shown_text = None
+        text_rects = []
+        overlay_shown = False
 
         while running:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    quit_gui()
+                if event.type in EXPOSE_EVENTS:
+                    shown = [[None] * WIDTH for _ in range(HEIGHT)]
+                    shown_text = None
+                    overlay_shown = False
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                    show_stats = not show_stats
                 if message != '':
                     if event.type == pygame.MOUSEBUTTONDOWN:
                         mx, my = pygame.mouse.get_pos()
                         if overlay_play_rect and overlay_play_rect.collidepoint(mx, my):
                             # Play Again: break to outer loop to show menu again
+                            executor.cancel()
+                            if ponderer is not None:
+                                ponderer.stop()
                             running = False
                             break
                         if overlay_quit_rect and overlay_quit_rect.collidepoint(mx, my):
-                            pygame.quit()
-                            sys.exit()
+                            quit_gui()
                     continue
 
                 if event.type == pygame.MOUSEBUTTONDOWN and message == '':
@@ -239,75 +367,81 @@ def main():
                     col = x // CELL_SIZE
                     if current == 'X' and ai_X is None:
                         if 0 <= col < b.width and b.can_add_to(col):
-                            b.add_checker('X', col)
-                            if b.is_win_for('X'):
+                            row = b.add_checker('X', col)
+                            if b.is_win_at(row, col):
                                 message = 'X wins!'
                             elif b.is_full():
                                 message = "It's a tie!"
                             else:
                                 current = 'O'
+                            if message != '' and ponderer is not None:
+                                ponderer.stop()
                     elif current == 'O' and ai_O is None:
                         if 0 <= col < b.width and b.can_add_to(col):
-                            b.add_checker('O', col)
-                            if b.is_win_for('O'):
+                            row = b.add_checker('O', col)
+                            if b.is_win_at(row, col):
                                 message = 'O wins!'
                             elif b.is_full():
                                 message = "It's a tie!"
                             else:
                                 current = 'X'
 
-            # AI move handling 
+            # AI move handling: results come back from the executor and
+            # are played here, so only this thread changes b
+            result = executor.poll()
+            if result is not None:
+                finish_ai_move(*result)
             if message == '' and not ai_thinking:
                 if current == 'X' and ai_X is not None:
-                    start_ai_move(ai_X, 'X', 'O')
+                    ai_thinking = True
+                    executor.submit(ai_X, b, 'X')
                 elif current == 'O' and ai_O is not None:
-                    start_ai_move(ai_O, 'O', 'X')
-
-            # draw board
-            draw_board(screen, b)
+                    ai_thinking = True
+                    executor.submit(ponderer or ai_O, b, 'O')
 
-            status = ''
-            if ai_thinking:
-                status = f'AI thinking ({current})...'
+            # draw only what changed since the last frame
+            if message != '':
+                if not overlay_shown:
+                    draw_board(screen, b)
+                    overlay_play_rect, overlay_quit_rect = draw_game_over(screen, message, font, small_font)
+                    pygame.display.flip()
+                    overlay_shown = True
             else:
-                status = f"{current}'s turn"
+                if ai_thinking:
+                    status = f'AI thinking ({current})...'
+                else:
+                    status = f"{current}'s turn"
+                text = (status, ai_stats if show_stats else '')
+                slots = b.slots
+                if text != shown_text or any(shown[r][c] != slots[r][c]
+                                             for r in range(HEIGHT) for c in range(WIDTH)):
+                    # text is blended onto the slots, so the slots under
+                    # the old and new lines are redrawn before it
+                    status_surf = text_surface(font, status)
+                    new_rects = [status_surf.get_rect(topleft=(10, 10))]
+                    if text[1]:
+                        stats_surf = text_surface(small_font, text[1])
+                        new_rects.append(stats_surf.get_rect(
+                            bottomleft=(10, screen.get_height() - 6)))
+                    for rect in text_rects + new_rects:
+                        forget_cells(shown, rect)
+                    dirty = draw_board(screen, b, shown)
+                    screen.blit(status_surf, new_rects[0])
+                    if text[1]:
+                        screen.blit(stats_surf, new_rects[1])
+                    pygame.display.update(dirty + text_rects + new_rects)
+                    shown_text = text
+                    text_rects = new_rects
 
-            text = font.render(status, True, COLORS['text'])
-            screen.blit(text, (10, 10))
-
-            # game end overlay
-            if message != '':
-                overlay_surf = pygame.Surface((screen.get_width(), screen.get_height()), pygame.SRCALPHA)
-                overlay_surf.fill((0, 0, 0, 120))
-                screen.blit(overlay_surf, (0, 0))
-
-                # panel
-                pw, ph = 420, 180
-                px = screen.get_width() // 2 - pw // 2
-                py = screen.get_height() // 2 - ph // 2
-                panel_rect = pygame.Rect(px, py, pw, ph)
-                pygame.draw.rect(screen, (245, 245, 245), panel_rect, border_radius=12)
-
-                big = font.render(message, True, (20, 20, 20))
-                screen.blit(big, (px + (pw - big.get_width()) // 2, py + 24))
-
-                overlay_play_rect = pygame.Rect(px + 44, py + ph - 64, 140, 44)
-                pygame.draw.rect(screen, (60, 140, 70), overlay_play_rect, border_radius=8)
-                ptxt = small_font.render('Play Again', True, (255, 255, 255))
-                screen.blit(ptxt, (overlay_play_rect.x + (overlay_play_rect.width - ptxt.get_width()) // 2,
-                                    overlay_play_rect.y + (overlay_play_rect.height - ptxt.get_height()) // 2))
-
-                overlay_quit_rect = pygame.Rect(px + pw - 44 - 140, py + ph - 64, 140, 44)
-                pygame.draw.rect(screen, (180, 60, 60), overlay_quit_rect, border_radius=8)
-                qtxt = small_font.render('Quit', True, (255, 255, 255))
-                screen.blit(qtxt, (overlay_quit_rect.x + (overlay_quit_rect.width - qtxt.get_width()) // 2,
-                                    overlay_quit_rect.y + (overlay_quit_rect.height - qtxt.get_height()) // 2))
-
-            pygame.display.flip()
             clock.tick(FPS)
 
         menu_running = True
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Play Connect Four.')
+    parser.add_argument('--height', type=int, default=6)
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--k', type=int, default=4, help='checkers in a row needed to win')
+    args = parser.parse_args()
+    main(args.height, args.width, args.k)
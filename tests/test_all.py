@@ -113,3 +113,953 @@ def test_ai_returns_valid_on_empty_board():
     ai = AIPlayer('X', 'LEFT', 1, algo='MINIMAX')
     col = ai.next_move(b)
     assert 0 <= col < b.width
+
+
+def test_slots_view_tracks_moves():
+    b = Board(6, 7)
+    b.add_checkers('3344')
+    assert b.slots[5][3] == 'X'
+    assert b.slots[4][3] == 'O'
+    b.remove_checker(3)
+    assert b.slots[4][3] == ' '
+    b2 = Board(6, 7)
+    b2.slots = b.slots
+    assert repr(b2) == repr(b)
+
+
+def _brute_force_win(b, checker):
+    s = b.slots
+    for row in range(b.height):
+        for col in range(b.width):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+                cells = [(row + i * dr, col + i * dc) for i in range(4)]
+                if all(0 <= r < b.height and 0 <= c < b.width and s[r][c] == checker
+                       for r, c in cells):
+                    return True
+    return False
+
+
+def test_bitboard_wins_match_brute_force():
+    import random
+    rng = random.Random(7)
+    for height, width in ((6, 7), (4, 4), (7, 9)):
+        for _ in range(200):
+            b = Board(height, width)
+            for _ in range(rng.randrange(height * width)):
+                col = rng.randrange(width)
+                if b.can_add_to(col):
+                    b.add_checker(rng.choice('XO'), col)
+            for checker in 'XO':
+                assert b.is_win_for(checker) == _brute_force_win(b, checker)
+
+
+def test_is_win_at_matches_full_scan_after_each_move():
+    import random
+    rng = random.Random(11)
+    for height, width in ((6, 7), (5, 9)):
+        for _ in range(100):
+            b = Board(height, width)
+            checker = 'X'
+            while not b.is_full():
+                col = rng.choice([c for c in range(width) if b.can_add_to(c)])
+                row = b.add_checker(checker, col)
+                assert b.slots[row][col] == checker
+                won = b.is_win_for(checker)
+                assert b.is_win_at(row, col) == won
+                if won:
+                    break
+                checker = 'O' if checker == 'X' else 'X'
+
+
+def test_play_and_undo_restore_board():
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    before = repr(b)
+    assert b.play('X', 5) == 5
+    assert b.play('O', 5) == 4
+    assert b.undo() == 5
+    assert b.undo() == 5
+    assert repr(b) == before
+
+
+def test_search_leaves_callers_board_untouched():
+    b = Board(6, 7)
+    b.add_checkers('33221')
+    before = repr(b)
+    for algo in ('MINIMAX', 'ALPHABETA'):
+        AIPlayer('O', 'LEFT', 3, algo=algo).next_move(b)
+        assert repr(b) == before
+
+
+def test_zobrist_hash_is_incremental():
+    b = Board(6, 7)
+    b.add_checkers('3452')
+    b2 = Board(6, 7)
+    b2.add_checkers('5432')
+    assert b.hash == b2.hash != 0
+    b.play('X', 0)
+    b.undo()
+    assert b.hash == b2.hash
+    assert b.copy().hash == b.hash
+
+
+def test_transposition_table_store_probe_and_replacement():
+    from connect4.transposition import TranspositionTable, EXACT, LOWER
+    tt = TranspositionTable(4, 'DEPTH')
+    tt.store(1, 5, 1, EXACT, 3)
+    assert tt.probe(1) == (5, 1, EXACT, 3)
+    assert tt.probe(2) is None
+    # same slot, shallower result: the deeper one is kept
+    tt.store(5, 2, 0, LOWER)
+    assert tt.probe(5) is None
+    assert tt.collisions == 1
+    always = TranspositionTable(4, 'ALWAYS')
+    always.store(1, 5, 1, EXACT)
+    always.store(5, 2, 0, LOWER)
+    assert always.probe(5) == (2, 0, LOWER, -1)
+    assert tt.stats()['hits'] == 1
+
+
+def test_alphabeta_with_transposition_table_matches_plain():
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    plain = AIPlayer('X', 'LEFT', 5, algo='ALPHABETA')
+    cached = AIPlayer('X', 'LEFT', 5, algo='ALPHABETA', tt_size=1 << 12)
+    assert cached.scores_for(b) == plain.scores_for(b)
+    assert cached.tt.hits > 0
+
+
+def test_move_orderings_put_center_and_killers_first():
+    from connect4.ordering import CenterOrdering, HeuristicOrdering
+    b = Board(6, 7)
+    assert CenterOrdering().columns(b, 3, 'X') == [3, 2, 4, 1, 5, 0, 6]
+    order = HeuristicOrdering()
+    order.cutoff(6, 3, 'X', ply=2)
+    assert order.columns(b, 3, 'X', tt_move=0, ply=2)[:2] == [0, 6]
+    assert order.columns(b, 2, 'X')[0] == 6  # history carries across depths
+    # killers belong to a ply, whatever depth is left there: a deeper
+    # iteration reaches ply 2 with more depth to go
+    assert order.killers == {2: [6]}
+    order.cutoff(5, 4, 'X', ply=2)
+    assert order.killers == {2: [5, 6]}
+
+
+def test_move_ordering_does_not_change_scores():
+    b = Board(6, 7)
+    b.add_checkers('332415')
+    scores = [AIPlayer('X', 'LEFT', 5, algo='ALPHABETA', ordering=o).scores_for(b)
+              for o in ('FIXED', 'CENTER', 'HEURISTIC')]
+    assert scores[0] == scores[1] == scores[2]
+
+
+def test_time_budget_deepens_iteratively():
+    import time
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    ai = AIPlayer('X', 'LEFT', 0, algo='ALPHABETA', tt_size=1 << 14)
+    start = time.perf_counter()
+    col = ai.next_move(b, time_budget=0.2)
+    assert time.perf_counter() - start < 1.0
+    assert b.can_add_to(col)
+    assert ai.last_depth >= 2
+    fixed = AIPlayer('X', 'LEFT', ai.last_depth, algo='ALPHABETA')
+    assert fixed.next_move(b) == col
+
+
+def test_time_budget_stops_at_a_full_board():
+    import time
+    b = Board(3, 3)
+    ai = AIPlayer('X', 'LEFT', 0, algo='MINIMAX', time_budget=5)
+    start = time.perf_counter()
+    assert b.can_add_to(ai.next_move(b))
+    assert time.perf_counter() - start < 1.0
+    assert ai.last_depth <= 9
+
+
+def test_line_table_and_window_evaluator():
+    from connect4.board import line_masks
+    from connect4.evaluation import WindowEvaluator
+    assert len(line_masks(6, 7)) == 69
+    assert line_masks(6, 7) is Board(6, 7).lines()
+    evaluate = WindowEvaluator()
+    b = Board(6, 7)
+    assert evaluate(b, 'X') == 0
+    b.add_checker('X', 3)
+    assert 0 < evaluate(b, 'X') < 1
+    assert evaluate(b, 'O') == -evaluate(b, 'X')
+    # a window X has already filled adds nothing rather than failing
+    b = Board(6, 7)
+    b.add_checkers('0101010')
+    assert -1 < evaluate(b, 'O') < 1
+    assert len(AIPlayer('O', 'LEFT', 2, evaluator='WINDOWS').scores_for(b)) == 7
+
+
+def test_evaluator_spreads_undecided_scores():
+    b = Board(6, 7)
+    b.add_checker('X', 3)
+    plain = AIPlayer('O', 'LEFT', 2, algo='ALPHABETA')
+    assert set(plain.scores_for(b)) == {50}
+    scored = AIPlayer('O', 'LEFT', 2, algo='ALPHABETA', evaluator='WINDOWS')
+    scores = scored.scores_for(b)
+    assert all(0 < s < 100 for s in scores)
+    assert len(set(scores)) > 1
+
+
+def test_board_pickles_compactly():
+    import pickle
+    b = Board(6, 7)
+    b.add_checkers('3324105')
+    b2 = pickle.loads(pickle.dumps(b))
+    assert repr(b2) == repr(b)
+    assert b2.hash == b.hash
+    assert len(pickle.dumps(b)) < 100
+
+
+def test_parallel_root_search_matches_serial():
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    serial = AIPlayer('X', 'RIGHT', 4, algo='ALPHABETA', evaluator='WINDOWS')
+    par = AIPlayer('X', 'RIGHT', 4, algo='ALPHABETA', evaluator='WINDOWS', workers=2)
+    assert par.scores_for(b) == serial.scores_for(b)
+    assert par.next_move(b) == serial.next_move(b)
+    # with tables, over several moves: whichever worker searches a column,
+    # it starts from an empty table, just like a fresh serial search of it.
+    # A deep search two plies earlier leaves deeper entries for the
+    # positions searched next, which a warm table would use.
+    kwargs = dict(algo='ALPHABETA', evaluator='WINDOWS', tt_size=1 << 14, workers=2)
+    first = AIPlayer('X', 'LEFT', 3, **kwargs)
+    second = AIPlayer('X', 'LEFT', 3, **kwargs)
+    for moves in ('3324', '332410', '33241065'):
+        b = Board(6, 7)
+        b.add_checkers(moves)
+        first.scores_for(b, 6)
+        b.add_checkers('33')
+        scores = first.scores_for(b)
+        assert second.scores_for(b) == scores
+        for col in range(7):
+            fresh = AIPlayer('X', 'LEFT', 3, 'ALPHABETA', tt_size=1 << 14, evaluator='WINDOWS')
+            assert scores[col] == fresh.column_score(b.copy(), col, 3)
+
+
+def test_opening_book_round_trip(tmp_path):
+    from connect4.book import OpeningBook, build_book
+    path = str(tmp_path / 'small.book')
+    n = build_book(path, 4, 5, 3,
+                   lambda checker: AIPlayer(checker, 'LEFT', 2, 'ALPHABETA',
+                                            evaluator='WINDOWS'))
+    book = OpeningBook(path)
+    assert len(book) == n
+    b = Board(4, 5)
+    b.add_checkers('0')
+    mirrored = Board(4, 5)
+    mirrored.add_checkers('4')
+    scores = book.lookup(b, 'O')
+    assert scores == AIPlayer('O', 'LEFT', 2, 'ALPHABETA', evaluator='WINDOWS').scores_for(b)
+    assert book.lookup(mirrored, 'O') == scores[::-1]
+    assert book.lookup(b, 'X') is None
+    b.add_checkers('123')
+    assert book.lookup(b, 'X') is None
+    ai = AIPlayer('X', 'LEFT', 6, book=book)
+    ai.next_move(Board(4, 5))
+    assert ai.last_depth == 0 and book.hits == 3
+    book.close()
+
+
+def test_batched_api_matches_board_methods():
+    import random
+    import pytest
+    np = pytest.importorskip('numpy')
+    from connect4 import batch
+    from connect4.evaluation import WindowEvaluator
+    rng = random.Random(3)
+    boards = []
+    for _ in range(50):
+        b = Board(6, 7)
+        for _ in range(rng.randrange(30)):
+            col = rng.randrange(7)
+            if b.can_add_to(col):
+                b.add_checker(rng.choice('XO'), col)
+        boards.append(b)
+    positions = batch.to_array(boards)
+    assert positions.shape == (50, 6, 7)
+    assert (batch.legal_moves(positions) ==
+            [[b.can_add_to(c) for c in range(7)] for b in boards]).all()
+    for checker in 'XO':
+        assert list(batch.wins(positions, checker)) == [b.is_win_for(checker) for b in boards]
+    # won boards included: a full window is worth 0 in both
+    evaluate = WindowEvaluator()
+    assert any(b.is_win_for('X') or b.is_win_for('O') for b in boards)
+    assert np.allclose(batch.evaluate(boards, 'O'), [evaluate(b, 'O') for b in boards])
+    # Boards bring their own k: four in a row does not win at 5
+    five = Board(6, 7, 5)
+    for col in (0, 6, 1, 6, 2, 6, 3):
+        five.add_checker('XO'[five.moves % 2], col)
+    assert list(batch.wins([five], 'X')) == [five.is_win_for('X')] == [False]
+    assert list(batch.wins(batch.to_array([five]), 'X', k=5)) == [False]
+    assert np.allclose(batch.evaluate([five], 'X'), [evaluate(five, 'X')])
+    with pytest.raises(AssertionError):
+        batch.wins([five, Board(6, 7)], 'X')
+
+
+def test_quiet_game_prints_nothing(capsys):
+    from connect4.connect_four import connect_four, RandomPlayer
+    b = connect_four(RandomPlayer('X'), AIPlayer('O', 'LEFT', 1), quiet=True)
+    assert b.is_full() or b.is_win_for('X') or b.is_win_for('O')
+    assert capsys.readouterr().out == ''
+
+
+def test_tournament_schedule_and_reproducible_results(tmp_path):
+    import json
+    from connect4.tournament import parse_spec, schedule, run_tournament, standings
+    assert parse_spec('ai:lookahead=3,algo=ALPHABETA') == \
+        {'type': 'ai', 'lookahead': 3, 'algo': 'ALPHABETA'}
+    players = {'ai': 'ai:lookahead=2', 'rand': 'random'}
+    jobs = schedule(players, 4, seed=10)
+    assert [(j['x'], j['o']) for j in jobs] == [('ai', 'rand'), ('rand', 'ai')] * 2
+    out = str(tmp_path / 'games.jsonl')
+    first = run_tournament(players, 4, seed=10, workers=2, out=out)
+    second = run_tournament(players, 4, seed=10, workers=2)
+    key = lambda r: r['game']
+    assert [r['moves'] for r in sorted(first, key=key)] == \
+           [r['moves'] for r in sorted(second, key=key)]
+    with open(out) as f:
+        assert len([json.loads(line) for line in f]) == 4
+    table = standings(first)
+    assert sum(row['wins'] + row['draws'] for row in table.values()) >= 4
+
+
+def test_benchmark_regression_check():
+    from benchmarks.bench import regressions
+    base = {'micro': {'copy': 100.0},
+            'search': {'ALPHABETA/4': {'seconds': 1.0, 'positions': {'p': {'found_win': True}}}}}
+    same = {'micro': {'copy': 105.0},
+            'search': {'ALPHABETA/4': {'seconds': 1.05, 'positions': {'p': {'found_win': True}}}}}
+    slow = {'micro': {'copy': 150.0},
+            'search': {'ALPHABETA/4': {'seconds': 2.0, 'positions': {'p': {'found_win': False}}}}}
+    assert regressions(base, same, 0.10) == []
+    assert len(regressions(base, slow, 0.10)) == 3
+
+
+def test_benchmark_positions_have_their_forced_wins():
+    from benchmarks.bench import board_for
+    from benchmarks.positions import POSITIONS
+    for position in POSITIONS:
+        if position['win_depth'] is not None and position['win_depth'] <= 5:
+            b, checker = board_for(position)
+            ai = AIPlayer(checker, 'LEFT', position['win_depth'], 'ALPHABETA')
+            assert max(ai.scores_for(b)) == 100, position['name']
+
+
+def test_search_stats_after_a_move():
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    ai = AIPlayer('X', 'LEFT', 4, algo='ALPHABETA', tt_size=1 << 12)
+    ai.next_move(b)
+    stats = ai.stats
+    assert sorted(stats.column_nodes) == list(range(7))
+    assert stats.nodes == sum(stats.column_nodes.values()) > 0
+    assert stats.depth == 4 and stats.max_ply == 4
+    assert stats.cutoffs > 0
+    assert stats.tt_hit_rate() is not None
+    assert 'depth 4' in stats.summary()
+    assert stats.as_dict()['nodes'] == stats.nodes
+    b = Board(6, 7)
+    b.add_checkers('33221')
+    ai = AIPlayer('O', 'LEFT', 4, algo='ALPHABETA')
+    ai.next_move(b)
+    assert ai.stats.terminal_nodes > 0
+
+
+def _brute_force_score(b, checker, moves):
+    """ the solver's score for b with checker to move, by full minimax """
+    best = None
+    other = 'O' if checker == 'X' else 'X'
+    for col in range(b.width):
+        if not b.can_add_to(col):
+            continue
+        row = b.play(checker, col)
+        if b.is_win_at(row, col):
+            score = (b.width * b.height + 1 - moves) // 2
+        elif moves + 1 == b.width * b.height:
+            score = 0
+        else:
+            score = -_brute_force_score(b, other, moves + 1)
+        b.undo()
+        if best is None or score > best:
+            best = score
+    return best
+
+
+def test_solver_matches_brute_force_on_a_small_board():
+    from connect4.solver import Solver
+    import random
+    rng = random.Random(3)
+    solver = Solver(4, 5)
+    for _ in range(8):
+        b = Board(4, 5)
+        checker = 'X'
+        for _ in range(rng.randrange(10, 13)):
+            col = rng.choice([c for c in range(5) if b.can_add_to(c)])
+            b.play(checker, col)
+            checker = 'O' if checker == 'X' else 'X'
+        if b.is_win_for('X') or b.is_win_for('O'):
+            continue
+        moves = b.moves
+        expected = _brute_force_score(b, checker, moves)
+        assert solver.solve(b, checker) == expected
+        best, bounds = solver.best_columns(b, checker)
+        assert best == expected
+        assert bounds == [best if s == best else s for s in bounds]
+        exact = solver.column_scores(b, checker)
+        for s, e in zip(bounds, exact):
+            assert (s is None) == (e is None)
+            if s is not None:
+                assert (s == best) == (e == best) and e <= s
+
+
+def test_plies_to_end():
+    from connect4.solver import Solver, plies_to_end
+    b = Board(4, 5)
+    b.add_checkers('001122')
+    score = Solver(4, 5).solve(b, 'X')
+    assert score == 7 and plies_to_end(score, 6, 20) == 1
+    assert plies_to_end(0, 6, 20) == 14
+
+
+def test_solve_player_finds_the_fastest_win():
+    b = Board(4, 5)
+    b.add_checkers('001122')
+    ai = AIPlayer('X', 'RIGHT', 0, algo='SOLVE')
+    assert ai.max_score_column(ai.scores_for(b)) == 3
+    assert ai.last_depth == 1
+    assert ai.stats.nodes == ai.stats.root_nodes + sum(ai.stats.column_nodes.values())
+    # O must block at once; every other column loses
+    b.add_checkers('4')
+    ai = AIPlayer('O', 'LEFT', 0, algo='SOLVE')
+    scores = ai.scores_for(b)
+    assert ai.max_score_column(scores) == 3
+    assert all(s < scores[3] for c, s in enumerate(scores) if c != 3)
+
+
+def test_ponderer_reuses_the_search_for_the_move_played():
+    from connect4.ponder import Ponderer
+    b = Board(6, 7)
+    b.add_checkers('3324')
+    ai = AIPlayer('O', 'LEFT', 3, algo='ALPHABETA', tt_size=1 << 12)
+    ponderer = Ponderer(ai)
+    ponderer.start(b)
+    assert ponderer.wait(60)
+    assert sorted(ponderer.results) == list(range(7))
+    b.add_checker('X', 5)
+    expected = AIPlayer('O', 'LEFT', 3, algo='ALPHABETA').next_move(b)
+    assert ponderer.next_move(b) == expected
+    assert ponderer.hits == 1 and ponderer.misses == 0
+    assert ai.stats.depth == 3
+
+
+def test_ponderer_stops_and_falls_back_to_searching():
+    from connect4.ponder import Ponderer
+    b = Board(6, 7)
+    ai = AIPlayer('O', 'LEFT', 12, algo='ALPHABETA')
+    ponderer = Ponderer(ai)
+    ponderer.start(b)
+    ponderer.stop()
+    assert ai.cancel_event is None
+    b.add_checkers('00')
+    # not one move on from the pondered position
+    assert ponderer.reply_to(b) is None
+    ai.lookahead = 2
+    assert ponderer.next_move(b) == AIPlayer('O', 'LEFT', 2).next_move(b)
+    assert ponderer.misses == 1
+
+
+def _wait_for_result(executor, seconds=30):
+    import time
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        result = executor.poll()
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    return None
+
+
+def test_executor_searches_a_snapshot_and_posts_the_move():
+    from connect4.executor import AIExecutor
+    executor = AIExecutor()
+    try:
+        b = Board(6, 7)
+        b.add_checkers('001122')
+        executor.submit(AIPlayer('X', 'LEFT', 2), b, 'X')
+        # the caller's board may change while the AI thinks
+        b.add_checker('X', 6)
+        tag, col, stats, error = _wait_for_result(executor)
+        assert (tag, col, error) == ('X', 3, None)
+        assert stats.forced
+    finally:
+        executor.shutdown()
+
+
+def test_executor_cancel_abandons_a_running_search():
+    import time
+    from connect4.executor import AIExecutor
+    executor = AIExecutor()
+    try:
+        deep = AIPlayer('X', 'LEFT', 12, algo='ALPHABETA')
+        executor.submit(deep, Board(6, 7), 'deep')
+        executor.submit(AIPlayer('X', 'LEFT', 12), Board(6, 7), 'queued')
+        time.sleep(0.2)
+        assert executor.busy()
+        executor.cancel()
+        deadline = time.time() + 10
+        while executor.busy() and time.time() < deadline:
+            time.sleep(0.01)
+        assert not executor.busy()
+        assert executor.poll() is None
+        assert deep.cancel_event is None
+        executor.submit(AIPlayer('X', 'LEFT', 1), Board(6, 7), 'next')
+        assert _wait_for_result(executor)[0] == 'next'
+    finally:
+        executor.shutdown()
+
+
+def test_board_move_counter_and_copy():
+    b = Board(2, 3)
+    assert not hasattr(b, '__dict__')
+    b.add_checkers('0011')
+    assert b.moves == 4 and not b.is_full()
+    c = b.copy()
+    b.add_checkers('22')
+    assert b.moves == 6 and b.is_full()
+    assert c.moves == 4 and not c.is_full() and c.can_add_to(2)
+    assert c.key() != b.key() and c.hash != b.hash
+    c.play('X', 2)
+    c.undo()
+    assert c.moves == 4
+    b.remove_checker(2)
+    assert b.moves == 5 and b.slots[0][2] == ' '
+    b.reset()
+    assert b.moves == 0
+
+
+def test_position_encodings_round_trip():
+    from connect4.records import position_key, position_from_key, \
+        encode_position, decode_position
+    b = Board(6, 7)
+    b.add_checkers('3324501')
+    key = position_key(b)
+    assert key < 1 << 64
+    assert repr(position_from_key(key, 6, 7)) == repr(b)
+    wide = Board(10, 12)
+    wide.add_checkers([11, 10, 11, 0, 5])
+    assert wide.slots[9][11] == 'X' and wide.slots[8][11] == 'X'
+    c = decode_position(encode_position(wide))
+    assert (c.height, c.width, c.k, c.key()) == (10, 12, 4, wide.key())
+    five = Board(6, 7, 5)
+    five.add_checkers([0, 6, 1, 6, 2, 6, 3])
+    c = decode_position(encode_position(five))
+    assert (c.k, c.key(), c.is_win_for('X')) == (5, five.key(), False)
+
+
+def test_game_records_stream_in_both_formats(tmp_path):
+    from connect4.records import RecordWriter, read_records, replay
+    games = [
+        {'height': 6, 'width': 7, 'moves': [3, 3, 2, 2, 1, 1, 0], 'result': 'X',
+         'move_times': [0.5, 0.000001, 0, 1.25, 2, 3, 4], 'x': 'deep'},
+        {'height': 10, 'width': 12, 'moves': [11, 200 % 12], 'result': None},
+    ]
+    for name in ('games.c4g', 'games.jsonl'):
+        path = str(tmp_path / name)
+        with RecordWriter(path) as out:
+            out.write(games[0])
+        # appending to an existing file
+        with RecordWriter(path) as out:
+            out.write(games[1])
+        records = read_records(path)
+        assert next(records) == games[0]
+        assert list(records) == games[1:]
+    assert replay(games[0]).is_win_for('X')
+    # a truncated final record is not returned
+    path = str(tmp_path / 'games.c4g')
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-3])
+    assert list(read_records(path)) == games[:1]
+
+
+def test_connect_k_wins_and_line_tables():
+    import pickle
+    from connect4.board import line_masks
+    b = Board(10, 12, k=5)
+    b.add_checkers([0, 0, 1, 1, 2, 2, 3, 3])
+    assert not b.is_win_for('X')
+    b.add_checker('X', 4)
+    assert b.is_win_for('X') and b.is_win_at(9, 4) and b.is_horizontal_win('X')
+    assert len(b.lines()) == len(line_masks(10, 12, 5))
+    assert b.lines() is Board(10, 12, 5).lines()
+    # 5 in a row on a 6x7 board: 3 horizontal, 2 vertical, 6 diagonal windows
+    assert len(line_masks(6, 7, 5)) == 6 * 3 + 7 * 2 + 2 * 2 * 3
+    # the shift-based checks agree with the line table for any k
+    import random
+    rng = random.Random(5)
+    for k in (3, 5, 6):
+        for _ in range(40):
+            c = Board(rng.randrange(3, 9), rng.randrange(3, 10), k)
+            for _ in range(rng.randrange(c.height * c.width)):
+                c.add_checker(rng.choice('XO'), rng.choice(
+                    [col for col in range(c.width) if c.can_add_to(col)]))
+            for checker in 'XO':
+                bits = c.bitboard(checker)
+                expected = any(bits & m == m for m in c.lines())
+                assert c.is_win_for(checker) == expected
+    c = pickle.loads(pickle.dumps(b))
+    assert c.k == 5 and c.is_win_for('X') and b.copy().k == 5
+
+
+def test_connect_k_evaluation_and_games():
+    from connect4.evaluation import WindowEvaluator, default_weights
+    from connect4.batch import evaluate, wins, to_array
+    from connect4.connect_four import connect_four
+    from connect4.tournament import play_game
+    assert default_weights(4) == (0, 1, 4, 16)
+    assert default_weights(5) == (0, 1, 4, 16, 64)
+    b = Board(7, 9, 5)
+    b.add_checkers([4, 4, 3, 5, 2, 6, 1])
+    value = WindowEvaluator()(b, 'X')
+    assert abs(evaluate([b], 'X', k=5)[0] - value) < 1e-12
+    assert not wins([b], 'X', k=5)[0] and wins(to_array([b]), 'X', k=4)[0]
+    end = connect_four(AIPlayer('X', 'LEFT', 2, evaluator='WINDOWS'),
+                       AIPlayer('O', 'LEFT', 1), quiet=True, height=5, width=6, k=3)
+    assert (end.height, end.width, end.k) == (5, 6, 3)
+    assert end.is_win_for('X') or end.is_win_for('O') or end.is_full()
+    moves, result, times = play_game(AIPlayer('X', 'LEFT', 2), AIPlayer('O', 'LEFT', 2),
+                                     4, 4, k=5)
+    # nobody can get 5 in a row on a 4x4 board
+    assert result == 'draw' and len(moves) == 16
+
+
+def test_mirror_hash_and_symmetric_root():
+    a = Board(6, 7)
+    a.add_checkers('3215')
+    b = Board(6, 7)
+    b.add_checkers('3451')
+    assert a.mirror_hash == b.hash and a.hash == b.mirror_hash
+    assert a.canonical_hash()[0] == b.canonical_hash()[0]
+    assert a.canonical_hash()[1] != b.canonical_hash()[1]
+    assert a.mirror_key() == b.key() and not a.is_symmetric()
+    s = Board(6, 7)
+    s.add_checkers('3315')
+    assert not s.is_symmetric()
+    s.remove_checker(5)
+    s.add_checker('X', 5)
+    assert s.is_symmetric() and s.hash == s.mirror_hash
+    assert s.copy().is_symmetric()
+    for tiebreak in ('LEFT', 'RIGHT'):
+        ai = AIPlayer('O', tiebreak, 3, algo='ALPHABETA', tt_size=1 << 10)
+        scores = ai.scores_for(s)
+        assert scores == scores[::-1]
+        assert sorted(ai.stats.column_nodes) == [0, 1, 2, 3]
+        best = ai.max_score_column(scores)
+        assert scores[best] == max(scores)
+        assert best == scores.index(max(scores)) if tiebreak == 'LEFT' else \
+            best == 6 - scores[::-1].index(max(scores))
+
+
+
+def test_tactics_finds_wins_blocks_and_losing_columns():
+    b = Board(6, 7)
+    for col in (1, 2, 3):
+        b.add_checker('X', col)
+    b.add_checker('O', 1)
+    b.add_checker('O', 2)
+    # X wins at the bottom of column 0 or 4: O cannot stop both
+    t = b.tactics('O')
+    assert t['wins'] == [] and t['blocks'] == [0, 4]
+    assert b.tactics('X')['wins'] == [0, 4]
+    assert b.safe_moves('O') == 0
+    b = Board(6, 7)
+    for col in (1, 2, 3):
+        b.add_checker('O', col)
+        b.add_checker('X', col)
+    # X's winning slots are on the second row of columns 0 and 4, above
+    # empty slots
+    t = b.tactics('O')
+    assert t['blocks'] == [] and t['losing'] == [0, 4]
+    assert b.columns_of(b.safe_moves('O')) == [1, 2, 3, 5, 6]
+    assert b.tactics('X')['even_threats'] == 2 and b.tactics('X')['odd_threats'] == 0
+
+
+def test_forced_moves_skip_the_search_and_pruning_keeps_values():
+    import random
+
+    class Unpruned(AIPlayer):
+        def pre_pass(self, board, depth, player_checker):
+            return None, [c for c in range(board.width) if board.can_add_to(c)]
+
+    b = Board(6, 7)
+    b.add_checkers('0616')
+    b.add_checker('X', 2)
+    ai = AIPlayer('O', 'LEFT', 4, algo='ALPHABETA')
+    assert b.tactics('O')['blocks'] == [3]
+    assert ai.next_move(b) == 3 and ai.stats.forced and ai.nodes == 0
+    assert ai.stats.summary() == 'forced move'
+    # a lookahead 1 search cannot see the threat, so nothing is forced
+    assert ai.forced_move(b, 1) is None
+    rng = random.Random(11)
+    for _ in range(12):
+        b = Board(6, 7)
+        for _ in range(rng.randrange(4, 16)):
+            b.add_checker('XO'[b.moves % 2], rng.choice(
+                [c for c in range(7) if b.can_add_to(c)]))
+        if b.is_win_for('X') or b.is_win_for('O'):
+            continue
+        checker = 'XO'[b.moves % 2]
+        for algo in ('MINIMAX', 'ALPHABETA'):
+            pruned = AIPlayer(checker, 'LEFT', 3, algo)
+            plain = Unpruned(checker, 'LEFT', 3, algo)
+            assert pruned.scores_for(b) == plain.scores_for(b)
+
+
+def test_server_hosts_games_and_refuses_work_when_busy():
+    import asyncio
+    import json
+    from connect4.server import GameServer
+    from connect4.loadgen import run_load, percentile
+
+    async def scenario():
+        server = GameServer(workers=2, max_pending=1, busy_timeout=0)
+        await server.start()
+        host, port = server.address()[:2]
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+
+            async def ask(message):
+                writer.write(json.dumps(message).encode() + b'\n')
+                return json.loads(await reader.readline())
+
+            reply = await ask({'op': 'new', 'id': 7, 'ai': 'X', 'player': 'ai:lookahead=2'})
+            assert reply['ok'] and reply['id'] == 7 and reply['moves'] == [reply['ai_move']]
+            game = reply['game']
+            assert (await ask({'op': 'move', 'game': game, 'col': 9}))['error'] == 'illegal move 9'
+            assert not (await ask({'op': 'move', 'game': 99, 'col': 0}))['ok']
+            reply = await ask({'op': 'move', 'game': game, 'col': 0, 'time_budget': 0.05})
+            assert reply['ok'] and len(reply['moves']) == 3 and reply['to_move'] == 'O'
+            assert (await ask({'op': 'close', 'game': game}))['ok']
+            writer.close()
+            # one AI move admitted at a time and no waiting: clients are
+            # turned away with 'busy' and retry until their games are done
+            result = await run_load(host, port, clients=6, games=6,
+                                    player='ai:lookahead=3', seed=1)
+            stats = await server.op_stats({})
+            return result, stats
+        finally:
+            await server.close()
+
+    result, stats = asyncio.run(scenario())
+    assert result.games == 6 and result.errors == 0
+    assert result.busy > 0 and stats['busy'] == result.busy
+    assert stats['games'] == 0 and stats['pending'] == 0
+    assert percentile([3, 1, 2, 4], 50) == 2 and percentile([5], 99) == 5
+
+
+def _fill_disk_table(path, start):
+    """ stores 200 keys from start in the DiskTable at path (run in a
+        worker process) """
+    from connect4.disktable import DiskTable
+    with DiskTable(path) as table:
+        for key in range(start, start + 200):
+            table.store(key * 7919, 3, key / 1000, 1, key % 7)
+
+
+def test_disk_table_persists_shares_and_survives_collisions(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+    import pytest
+    from connect4.disktable import DiskTable, HEADER_SIZE, ENTRY
+    from connect4.transposition import EXACT, LOWER
+
+    path = str(tmp_path / 'table.c4tt')
+    table = DiskTable(path, 16)
+    assert table.size == 16 and table.probe(5) is None
+    table.store(5, 4, 0.25, EXACT, 3)
+    assert table.probe(5) == (4, 0.25, EXACT, 3)
+    # 4 buckets of 4: keys 5 + 4i all land in 5's bucket
+    for i, depth in zip(range(1, 5), (6, 2, 7, 5)):
+        table.store(5 + 4 * i, depth, -1.0, LOWER)
+    assert table.probe(5 + 8) is None and table.collisions == 1
+    assert table.probe(5) == (4, 0.25, EXACT, 3)
+    # the 'DEPTH' policy keeps a full bucket's deeper entries
+    table.store(5 + 4 * 9, 1, 0.0, EXACT)
+    assert table.probe(5 + 4 * 9) is None
+    table.close()
+    # reopening keeps the entries and the size it was made with
+    table = DiskTable(path, 1 << 10)
+    assert table.size == 16 and table.probe(5 + 4 * 3) == (7, -1.0, LOWER, -1)
+    assert DiskTable(path, salt=1).probe(5) is None
+    # a torn entry no longer matches its key: 5 is in the first slot of
+    # bucket 1, and this flips a byte of its value
+    table._mm[HEADER_SIZE + 4 * ENTRY.size + 9] ^= 0xFF
+    assert table.probe(5) is None and table.probe(5 + 4 * 1) == (6, -1.0, LOWER, -1)
+    table.close()
+    with open(str(tmp_path / 'other'), 'wb') as f:
+        f.write(b'not a table' * 10)
+    with pytest.raises(ValueError):
+        DiskTable(str(tmp_path / 'other'))
+
+    path = str(tmp_path / 'shared.c4tt')
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        list(pool.map(_fill_disk_table, [path, path], [0, 200]))
+    with DiskTable(path) as table:
+        assert all(table.probe(key * 7919) == (3, key / 1000, 1, key % 7)
+                   for key in range(400))
+
+
+def test_disk_cache_keeps_scores_and_warms_new_players(tmp_path):
+    path = str(tmp_path / 'cache.c4tt')
+    b = Board(6, 7)
+    b.add_checkers('33425')
+    plain = AIPlayer('X', 'LEFT', 6, 'ALPHABETA', evaluator='WINDOWS')
+    cold = AIPlayer('X', 'LEFT', 6, 'ALPHABETA', evaluator='WINDOWS', cache=path)
+    scores = plain.scores_for(b)
+    assert cold.scores_for(b) == scores
+    warm = AIPlayer('X', 'LEFT', 6, 'ALPHABETA', evaluator='WINDOWS', cache=path)
+    assert warm.scores_for(b) == scores
+    assert warm.stats.tt_hits > 0 and warm.nodes < cold.nodes
+    # another kind of player keeps its own entries in the same file
+    other = AIPlayer('O', 'LEFT', 6, 'ALPHABETA', evaluator='WINDOWS', cache=path)
+    assert other.scores_for(b) == AIPlayer('O', 'LEFT', 6, 'ALPHABETA',
+                                           evaluator='WINDOWS').scores_for(b)
+    small = Board(4, 5)
+    small.add_checkers('2211304')
+    solver = AIPlayer('O', 'LEFT', 0, 'SOLVE', cache=path)
+    assert solver.scores_for(small) == AIPlayer('O', 'LEFT', 0, 'SOLVE').scores_for(small)
+
+
+def test_engine_protocol_plays_many_games_in_one_process():
+    import io
+    import subprocess
+    import sys
+    import time
+    from connect4.engine import Engine
+
+    out = io.StringIO()
+    engine = Engine(out)
+    engine.run(['isready', 'set lookahead 4', 'position 3342', 'go', 'stats',
+                'play 9', 'set colour red', 'bogus', 'position 0000000',
+                'newgame 4 5', 'position 2 2 1 1', 'set algo solve', 'go',
+                'newgame', 'set algo ALPHABETA', 'set lookahead 30', 'go', 'stop'])
+    lines = out.getvalue().splitlines()
+    b = Board(6, 7)
+    b.add_checkers('3342')
+    expected = AIPlayer('X', 'LEFT', 4, 'ALPHABETA', evaluator='WINDOWS').next_move(b)
+    assert lines[0] == 'readyok' and lines[1].startswith('info ')
+    assert lines[2] == 'bestmove ' + str(expected)
+    assert lines[3].startswith('stats ') and '"move": ' + str(expected) in lines[3]
+    assert lines[4:8] == ['error illegal move 9',
+                          'error usage: set NAME VALUE, NAME one of ' +
+                          'algo lookahead time evaluator ordering tiebreak ' +
+                          'tt_size tt_policy workers book cache',
+                          'error unknown command bogus', 'error illegal move 0']
+    small = Board(4, 5)
+    small.add_checkers('2211')
+    assert lines[9] == 'bestmove ' + str(AIPlayer('X', 'LEFT', 0, 'SOLVE').next_move(small))
+    # stopped long before depth 30: the move still comes back
+    assert lines[11].startswith('bestmove ') and len(lines) == 12
+    # one player per side and set of options, kept between games
+    assert len(engine.players) == 2
+    # negative depths would search without end: they are refused
+    out = io.StringIO()
+    Engine(out).run(['go depth -3', 'go time -1', 'set lookahead -1', 'set time 0',
+                     'set lookahead 2', 'go', 'set lookahead -1', 'go depth 1'])
+    assert out.getvalue().splitlines()[:4] == [
+        'error usage: go [depth N | time SECONDS]',
+        'error usage: go [depth N | time SECONDS]',
+        'error bad value for lookahead', 'error bad value for time']
+    lines = out.getvalue().splitlines()[4:]
+    assert [line.split()[0] for line in lines] == ['info', 'bestmove', 'error', 'info', 'bestmove']
+    # solves and parallel searches stop too, and the workers are free again
+    def slowly(script):
+        for line in script:
+            if line == 'stop':
+                time.sleep(1)
+            yield line
+
+    for script in (['set algo solve', 'position 3', 'go', 'stop'],
+                   ['set workers 2', 'set lookahead 14', 'go', 'stop', 'go depth 2']):
+        out = io.StringIO()
+        start = time.perf_counter()
+        Engine(out).run(slowly(script))
+        assert time.perf_counter() - start < 10
+        moves = [line for line in out.getvalue().splitlines() if line.startswith('bestmove ')]
+        assert len(moves) == sum(line.startswith('go') for line in script)
+        assert all(0 <= int(line.split()[1]) < 7 for line in moves)
+    done = subprocess.run([sys.executable, '-c', 'import sys, connect4.engine; '
+                           'print(sorted({"numpy", "pygame"} & set(sys.modules)))'],
+                          capture_output=True, text=True)
+    assert done.stdout.strip() == '[]'
+
+
+def test_server_accepts_only_safe_player_options():
+    import asyncio
+    import json
+    from connect4.server import GameServer
+
+    server = GameServer(max_lookahead=6)
+
+    def new(player):
+        line = json.dumps({'op': 'new', 'ai': 'O', 'player': player})
+        return asyncio.run(server.respond(line))
+
+    assert new('ai:lookahead=6,algo=ALPHABETA,evaluator=WINDOWS,tiebreak=RANDOM')['ok']
+    assert new('random')['ok']
+    for spec, error in (('ai:lookahead=40', 'lookahead must be an int from 0 to 6'),
+                        ('ai:lookahead=-1', 'lookahead must be an int from 0 to 6'),
+                        ('ai:workers=8', 'workers cannot be set by clients'),
+                        ('ai:tt_size=1000000000', 'tt_size cannot be set by clients'),
+                        ('ai:bogus=3', 'bogus cannot be set by clients'),
+                        ('ai:algo=SOLVE', 'algo must be one of MINIMAX, ALPHABETA'),
+                        ('human', 'bad player spec')):
+        reply = new(spec)
+        assert not reply['ok'] and reply['error'] == error
+    assert len(server.games) == 2
+
+
+def test_server_bounds_moves_sent_without_a_time_budget():
+    import asyncio
+    import json
+    import time
+    from connect4.server import GameServer
+
+    async def scenario():
+        server = GameServer(workers=1, max_time_budget=1.0)
+        await server.start()
+        try:
+            # far too deep to finish on 32x32: stopped at the server's limit
+            line = json.dumps({'op': 'new', 'ai': 'X', 'height': 32, 'width': 32,
+                               'player': 'ai:lookahead=8'})
+            start = time.perf_counter()
+            reply = await server.respond(line)
+            return reply, time.perf_counter() - start
+        finally:
+            await server.close()
+
+    reply, seconds = asyncio.run(scenario())
+    assert reply['ok'] and 0 <= reply['ai_move'] < 32
+    assert reply['stats']['depth'] == 1 and seconds < 5
+
+
+def test_server_refuses_client_cache_and_book_paths(tmp_path):
+    import asyncio
+    import json
+    import os
+    from connect4.server import GameServer
+
+    server = GameServer()
+    for option in ('cache', 'book'):
+        path = str(tmp_path / ('client.' + option))
+        line = json.dumps({'op': 'new', 'ai': 'X',
+                           'player': 'ai:' + option + '=' + path + ',tt_size=4'})
+        reply = asyncio.run(server.respond(line))
+        assert not reply['ok'] and reply['error'] == option + ' cannot be set by clients'
+        assert not os.path.exists(path)
+    assert server.games == {}